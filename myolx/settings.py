@@ -102,6 +102,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # File-backed test database: in-memory SQLite fails concurrent writers with
+        # "table is locked" instead of waiting, which the threaded tests need
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -142,6 +145,33 @@ SIMPLE_JWT = {
 
 
 
+# Caches
+# The catalog cache holds the catalog and discount versions, the response
+# cache and its rebuild locks, so every worker process has to see the same
+# one: set CATALOG_CACHE_URL (e.g. redis://localhost:6379/1) when running
+# more than one. The local-memory fallback is for development and tests.
+CATALOG_CACHE_URL = os.environ.get("CATALOG_CACHE_URL")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": CATALOG_CACHE_URL,
+        "KEY_PREFIX": "myolx",
+        "TIMEOUT": 60 * 10,
+    } if CATALOG_CACHE_URL else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "catalog",
+        "TIMEOUT": 60 * 10,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+CATALOG_CACHE_ALIAS = "catalog"
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -168,3 +198,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Request bodies up to 16MB, so bulk repricing can take ~100k id/price pairs
+# as JSON (file uploads are streamed to disk and not limited by this)
+DATA_UPLOAD_MAX_MEMORY_SIZE = 16 * 1024 * 1024
+
+# Worker processes that generate product image derivatives (see product.images)
+PRODUCT_IMAGE_WORKERS = 2
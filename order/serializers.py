@@ -1,8 +1,12 @@
 from rest_framework import serializers
+from .constants import DEFAULT_OrderStatus
 from .models import Order, OrderItem, OrderStatus, PaymentStatus, OrderStatusHistory
 from product.models import Product
 from decimal import Decimal
 from django.db import transaction
+from django.utils import timezone
+from product.pricing import price_cart
+from product.redemption import DiscountUnavailable, redeem_cart_discounts
 from product.serializers import ProductImageSerializer
 
 class OrderStatusSerializer(serializers.ModelSerializer):
@@ -115,18 +119,45 @@ class OrderSerializer(serializers.ModelSerializer):
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     items = OrderItemCreateSerializer(many=True)
+    # Optional order-level discount chosen by the customer
+    discount_id = serializers.IntegerField(min_value=1, required=False, allow_null=True, write_only=True)
     
     class Meta:
         model = Order
         fields = [
             'shipping_address', 'shipping_city', 'shipping_state',
-            'shipping_zipcode', 'shipping_country', 'notes', 'items'
+            'shipping_zipcode', 'shipping_country', 'notes', 'items', 'discount_id'
         ]
     
+    def validate(self, data):
+        if data.get('discount_id') is not None:
+            product_ids = [item['product'].id for item in data['items']]
+            if len(set(product_ids)) != len(product_ids):
+                raise serializers.ValidationError({"items": "List each product once when using a discount."})
+        return data
+    
+    def price_discount(self, items_data, discount_id, now):
+        """Breakdown of the chosen order discount over the items, as POST /products/cart/price/ gives it"""
+        try:
+            breakdown = price_cart(
+                [{'product_id': item['product'].id, 'quantity': item.get('quantity', 1)} for item in items_data],
+                discount_id,
+                now,
+                line_discounts=False,
+            )
+        except LookupError as exc:
+            missing = ', '.join(str(product_id) for product_id in exc.args[0])
+            raise serializers.ValidationError({"items": f"Products are not available: {missing}"})
+        if breakdown['order_discount'] is None:
+            raise serializers.ValidationError({"discount": breakdown['unapplied_discounts'][0]['reason']})
+        return breakdown
+    
     @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
+        discount_id = validated_data.pop('discount_id', None)
         request = self.context.get('request')
+        now = timezone.now()
         
         # Calculate totals
         subtotal = Decimal('0.00')
@@ -140,12 +171,19 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         tax_amount = subtotal * Decimal('0.10')  # 10% tax
         shipping_cost = Decimal('10.00')
         discount_amount = validated_data.get('discount_amount', Decimal('0.00'))
+        breakdown = None
+        if discount_id is not None:
+            breakdown = self.price_discount(items_data, discount_id, now)
+            discount_amount = breakdown['order_discount_amount']
 
         # ✅ Compute total
         total = subtotal + tax_amount + shipping_cost - discount_amount
 
-        # Default order status
-        initial_status = OrderStatus.objects.filter(code='cart').first()
+        # Default order status; 'cart' is not among the seeded statuses
+        initial_status = (
+            OrderStatus.objects.filter(code='cart').first()
+            or OrderStatus.objects.get(pk=DEFAULT_OrderStatus.PENDING)
+        )
         
         # Create order
         order = Order.objects.create(
@@ -153,6 +191,7 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             subtotal=subtotal,
             tax_amount=tax_amount,
             shipping_cost=shipping_cost,
+            discount=breakdown['order_discount'] if breakdown else None,
             discount_amount=discount_amount,
             total=total,
             status=initial_status,
@@ -163,6 +202,13 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         for item_data in items_data:
             OrderItem.objects.create(order=order, **item_data)
 
+        # Take the discount's use; past its usage limit the whole order rolls back
+        if breakdown is not None:
+            try:
+                redeem_cart_discounts(order, breakdown, user=request.user, now=now)
+            except DiscountUnavailable as exc:
+                raise serializers.ValidationError({"discount": str(exc)})
+
         OrderStatusHistory.objects.create(
             order=order,
             status=initial_status,
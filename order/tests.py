@@ -1,3 +1,114 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from product.cache import get_catalog_cache
+from product.models import Discount, DiscountUsage, DiscountUsageDaily, Product
+from users.models import UserProfile
+
+from .models import Order
+from .serializers import OrderCreateSerializer
+
+
+class CheckoutDiscountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        order_config = apps.get_app_config('order')
+        order_config.create_default_order_statuses()
+        order_config.create_default_payment_statuses()
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        cls.customer = UserProfile.objects.create_user('customer', 'customer@example.com', 'pw')
+        cls.phone = Product.objects.create(title='Phone', description='d', price=Decimal('100.00'), vendor=cls.vendor)
+        cls.case = Product.objects.create(title='Case', description='d', price=Decimal('20.00'), vendor=cls.vendor)
+
+    def setUp(self):
+        # Discounts of earlier tests were rolled back under the process-wide discount index;
+        # a fresh discounts version makes it reload
+        get_catalog_cache().clear()
+        self.request = RequestFactory().post('/orders/')
+        self.request.user = self.customer
+
+    def discount(self, **fields):
+        now = timezone.now()
+        values = dict(
+            name='Sale', discount_type='percentage', percentage=Decimal('10'),
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1), created_by=self.vendor,
+        )
+        values.update(fields)
+        return Discount.objects.create(**values)
+
+    def checkout(self, items, user=None, **data):
+        body = {
+            'shipping_address': 'Street 1', 'shipping_city': 'City', 'shipping_state': 'State',
+            'shipping_zipcode': '12345', 'shipping_country': 'Country',
+            'items': [
+                {'product': product.id, 'quantity': quantity, 'price': str(product.price)} for product, quantity in items
+            ],
+            **data,
+        }
+        if user is not None:
+            self.request.user = user
+        serializer = OrderCreateSerializer(data=body, context={'request': self.request})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            return serializer.save()
+
+    def test_chosen_order_discount_is_redeemed(self):
+        # Line discounts are not applied on their own
+        self.discount(name='Phones').products.set([self.phone])
+        order_discount = self.discount(
+            name='Order', discount_type='fixed', fixed_amount=Decimal('5.00'), apply_to_all_products=True
+        )
+
+        order = self.checkout([(self.phone, 2), (self.case, 1)], discount_id=order_discount.id)
+
+        self.assertEqual(order.subtotal, Decimal('220.00'))
+        self.assertEqual(order.discount, order_discount)
+        self.assertEqual(order.discount_amount, Decimal('5.00'))
+        self.assertEqual(
+            sorted(DiscountUsage.objects.values_list('discount_id', 'product_id', 'discount_amount')),
+            sorted([(order_discount.id, self.phone.id, Decimal('4.55')), (order_discount.id, self.case.id, Decimal('0.45'))])
+        )
+        order_discount.refresh_from_db()
+        self.assertEqual(order_discount.usage_count, 1)
+        self.assertEqual(DiscountUsageDaily.objects.get(discount=order_discount).uses, 1)
+
+    def test_an_order_discount_over_several_lines_takes_one_use(self):
+        order_discount = self.discount(name='Order', apply_to_all_products=True, usage_limit=2)
+
+        # Order numbers are only unique per second and user
+        customers = [
+            UserProfile.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pw') for i in range(3)
+        ]
+        self.checkout([(self.phone, 3), (self.case, 5)], customers[0], discount_id=order_discount.id)
+        self.checkout([(self.phone, 1), (self.case, 1)], customers[1], discount_id=order_discount.id)
+        with self.assertRaises(ValidationError):
+            self.checkout([(self.case, 1)], customers[2], discount_id=order_discount.id)
+
+        order_discount.refresh_from_db()
+        self.assertEqual(order_discount.usage_count, 2)
+        self.assertEqual(DiscountUsage.objects.count(), 4)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_exhausted_discount_is_rejected_and_rolled_back(self):
+        order_discount = self.discount(name='Order', apply_to_all_products=True, usage_limit=1, usage_count=1)
+
+        with self.assertRaises(ValidationError) as raised:
+            self.checkout([(self.phone, 1)], discount_id=order_discount.id)
+
+        self.assertIn('discount', raised.exception.detail)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(DiscountUsage.objects.exists())
+
+    def test_orders_without_a_discount_redeem_nothing(self):
+        self.discount(name='Phones').products.set([self.phone])
+
+        order = self.checkout([(self.phone, 1)])
+
+        self.assertIsNone(order.discount)
+        self.assertEqual(order.discount_amount, Decimal('0.00'))
+        self.assertFalse(DiscountUsage.objects.exists())
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "product"
+
+    def ready(self):
+        """Connect signal handlers (search index sync) and register system checks"""
+        from . import checks, signals  # noqa: F401
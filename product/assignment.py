@@ -0,0 +1,158 @@
+"""
+Set-based assignment of discounts to products and categories.
+
+Targets are given as ids, or for products also as a ProductFilter expression
+(the query parameters of the product listing). Ownership is checked with one
+query per CHUNK_SIZE ids instead of one IN clause over the whole selection,
+the selection is diffed against the discount's current links, and only the
+difference is written, with chunked bulk INSERTs and DELETEs. Callers run it
+inside transaction.atomic() so a rejected selection leaves nothing behind.
+
+The through rows are written directly, so m2m_changed is sent once per
+direction with the full pk_set, as RelatedManager.add() and remove() would,
+and the discount index and catalog cache follow (see product.signals).
+"""
+from django.db import router
+from django.db.models.signals import m2m_changed
+
+from .filters import ProductFilter
+from .models import Category, Discount, Product
+
+CHUNK_SIZE = 500
+MODES = ('add', 'remove', 'replace')
+
+# Ids quoted back in error messages
+MAX_REPORTED_IDS = 20
+
+
+class AssignmentError(Exception):
+    """The selection holds products or categories the user may not assign"""
+
+    def __init__(self, message, ids):
+        ids = sorted(ids)
+        shown = ', '.join(str(pk) for pk in ids[:MAX_REPORTED_IDS])
+        more = f" and {len(ids) - MAX_REPORTED_IDS} more" if len(ids) > MAX_REPORTED_IDS else ""
+        super().__init__(f"{message}: {shown}{more}")
+        self.ids = ids
+
+
+def chunked(ids, size=CHUNK_SIZE):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def assignable_products(user):
+    """Products `user` may attach discounts to: a vendor's own, or any for admins"""
+    if user.is_vendor:
+        return Product.objects.filter(vendor=user)
+    return Product.objects.all()
+
+
+def product_selection(user, product_ids=(), filters=None):
+    """
+    Ids of the listed products plus the active products matching `filters`.
+
+    Raises AssignmentError if a listed product does not exist or, for
+    vendors, belongs to someone else.
+    """
+    products = assignable_products(user)
+    requested = set(product_ids)
+    selected = set()
+    for chunk in chunked(requested):
+        selected.update(products.filter(id__in=chunk).values_list('id', flat=True))
+    if selected != requested:
+        message = (
+            "You can only assign discounts to your own products" if user.is_vendor
+            else "Products do not exist"
+        )
+        raise AssignmentError(message, requested - selected)
+
+    if filters:
+        matching = ProductFilter(data=filters, queryset=products.filter(is_active=True)).qs
+        selected.update(matching.values_list('id', flat=True))
+    return selected
+
+
+def category_selection(user, category_ids):
+    """
+    Ids of the listed categories; vendors may only pick categories holding
+    some of their products. Raises AssignmentError otherwise.
+    """
+    requested = set(category_ids)
+    selected = set()
+    for chunk in chunked(requested):
+        if user.is_vendor:
+            rows = Product.categories.through.objects.filter(
+                category_id__in=chunk, product__vendor=user
+            ).values_list('category_id', flat=True).distinct()
+        else:
+            rows = Category.objects.filter(id__in=chunk).values_list('id', flat=True)
+        selected.update(rows)
+    if selected != requested:
+        message = (
+            "You can only assign discounts to categories containing your products" if user.is_vendor
+            else "Categories do not exist"
+        )
+        raise AssignmentError(message, requested - selected)
+    return selected
+
+
+def sync_links(discount, field_name, target_ids, mode='add'):
+    """
+    Add, remove or replace the discount's `field_name` links ('products' or
+    'categories') with `target_ids`; returns (added ids, removed ids).
+    """
+    field = Discount._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_field_name() + '_id'
+    target = field.m2m_reverse_field_name() + '_id'
+    links = through.objects.filter(**{source: discount.pk})
+
+    target_ids = set(target_ids)
+    current = set(links.values_list(target, flat=True))
+    added = target_ids - current if mode in ('add', 'replace') else set()
+    if mode == 'remove':
+        removed = target_ids & current
+    elif mode == 'replace':
+        removed = current - target_ids
+    else:
+        removed = set()
+
+    using = router.db_for_write(through, instance=discount)
+    signal = dict(
+        sender=through, instance=discount, reverse=False,
+        model=field.related_model, using=using,
+    )
+    if removed:
+        m2m_changed.send(action='pre_remove', pk_set=removed, **signal)
+        for chunk in chunked(removed):
+            links.filter(**{f'{target}__in': chunk}).delete()
+        m2m_changed.send(action='post_remove', pk_set=removed, **signal)
+    if added:
+        m2m_changed.send(action='pre_add', pk_set=added, **signal)
+        through.objects.using(using).bulk_create(
+            [through(**{source: discount.pk, target: pk}) for pk in sorted(added)],
+            batch_size=CHUNK_SIZE,
+            # A concurrent assignment may have linked some of them meanwhile
+            ignore_conflicts=True,
+        )
+        m2m_changed.send(action='post_add', pk_set=added, **signal)
+    return added, removed
+
+
+def assign_discount(discount, user, products=None, categories=None, filters=None, mode='add'):
+    """
+    Apply one assignment request; `products`/`filters` and `categories` left
+    as None are not touched. Returns {field: {"added", "removed"}} counts.
+    """
+    result = {}
+    if products is not None or filters:
+        selected = product_selection(user, products or (), filters)
+        added, removed = sync_links(discount, 'products', selected, mode)
+        result['products'] = {'added': len(added), 'removed': len(removed)}
+    if categories is not None:
+        selected = category_selection(user, categories)
+        added, removed = sync_links(discount, 'categories', selected, mode)
+        result['categories'] = {'added': len(added), 'removed': len(removed)}
+    return result
@@ -0,0 +1,270 @@
+"""
+Versioned response cache for the public catalog endpoints.
+
+Cached entries are keyed on the catalog version, the view and its normalized
+query parameters. Any write to the catalog bumps the version once the
+transaction commits (see product.signals), which orphans every older entry
+at once instead of tracking individual keys. The same version backs the
+ETag/Last-Modified headers of conditional GETs. The backend is whatever the
+CATALOG_CACHE_ALIAS cache is configured as. With several worker processes it
+must be shared (settings use Redis when CATALOG_CACHE_URL is set): with the
+local-memory backend each process has its own version and misses the
+writes made through the others.
+"""
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+CATALOG_CACHE_ALIAS = getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog')
+
+# Unix seconds; renamed from 'catalog:version', which held nanoseconds
+VERSION_KEY = 'catalog:version:s'
+HITS_KEY = 'catalog:stats:hits'
+MISSES_KEY = 'catalog:stats:misses'
+PRICE_SERIES_KEY = 'price-series:daily:{}'
+DISCOUNTS_VERSION_KEY = 'discounts:version'
+
+# Serializes catalog version bumps (seconds)
+VERSION_LOCK_KEY = 'catalog:version:lock'
+VERSION_LOCK_TIMEOUT = 5
+VERSION_LOCK_WAIT = 1
+
+# Single-flight rebuilds of cached responses (seconds)
+REBUILD_LOCK_TIMEOUT = 30
+# Waiters give up well before the lock expires: a stuck rebuild costs them a
+# short delay, not a request timeout
+REBUILD_WAIT = REBUILD_LOCK_TIMEOUT / 20
+REBUILD_POLL_INTERVAL = 0.02
+
+
+def get_catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    cache = get_catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version
+        cache.add(VERSION_KEY, int(time.time()), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Move the version to max(version + 1, current Unix second).
+
+    The version doubles as the catalog's Last-Modified time, which has whole
+    seconds, so every bump takes a second of its own: two versions never
+    share a Last-Modified value. Bumps are serialized by a short lock in the
+    catalog cache (cache.add is atomic), so the read and the write form a
+    compare-and-set and concurrent bumps can neither repeat a catch-up with
+    the clock nor move the version back. If the lock stays taken longer than
+    VERSION_LOCK_WAIT, e.g. after its holder died, the bump falls back to a
+    plain atomic increment.
+    """
+    cache = get_catalog_cache()
+    deadline = time.monotonic() + VERSION_LOCK_WAIT
+    while not cache.add(VERSION_LOCK_KEY, 1, timeout=VERSION_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            try:
+                cache.incr(VERSION_KEY)
+            except ValueError:
+                cache.add(VERSION_KEY, int(time.time()), timeout=None)
+            return
+        time.sleep(REBUILD_POLL_INTERVAL)
+    try:
+        current = cache.get(VERSION_KEY) or 0
+        cache.set(VERSION_KEY, max(current + 1, int(time.time())), timeout=None)
+    finally:
+        cache.delete(VERSION_LOCK_KEY)
+
+
+def invalidate_catalog():
+    """Bump the catalog version when the current transaction commits"""
+    transaction.on_commit(bump_catalog_version)
+
+
+def get_discounts_version():
+    """Counter bumped on every discount write; tells processes to reload their discount index"""
+    cache = get_catalog_cache()
+    version = cache.get(DISCOUNTS_VERSION_KEY)
+    if version is None:
+        cache.add(DISCOUNTS_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(DISCOUNTS_VERSION_KEY)
+    return version
+
+
+def bump_discounts_version():
+    """Increment the discounts version and return the new value"""
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(DISCOUNTS_VERSION_KEY)
+    except ValueError:
+        cache.add(DISCOUNTS_VERSION_KEY, time.time_ns(), timeout=None)
+        return cache.get(DISCOUNTS_VERSION_KEY)
+
+
+def price_series_key(product_id):
+    """Cached daily price buckets of one product (see product.timeseries)"""
+    return PRICE_SERIES_KEY.format(product_id)
+
+
+def invalidate_price_series(product_ids):
+    """Drop the cached daily buckets of these products when the transaction commits"""
+    keys = [price_series_key(product_id) for product_id in product_ids]
+    if keys:
+        transaction.on_commit(lambda: get_catalog_cache().delete_many(keys))
+
+
+def catalog_cache_key(prefix, *parts):
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'catalog:{get_catalog_version()}:{prefix}:{digest}'
+
+
+def normalized_query(request):
+    """Query parameters in a canonical order, so equivalent URLs share an entry"""
+    return tuple(sorted(
+        (key, tuple(sorted(request.query_params.getlist(key))))
+        for key in request.query_params
+    ))
+
+
+def _count(key):
+    cache = get_catalog_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_cache_stats():
+    cache = get_catalog_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0,
+        'version': get_catalog_version(),
+    }
+
+
+def wait_for_entry(cache, key, wait=REBUILD_WAIT):
+    """Poll for an entry another request is building; None if it does not show up in time"""
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(REBUILD_POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return None
+
+
+def cache_catalog_response(timeout=DEFAULT_TIMEOUT):
+    """
+    Cache successful responses of an APIView `get` method.
+
+    The serialized data is stored rather than the rendered bytes so content
+    negotiation still works on hits. `timeout` may be a callable taking the
+    view arguments (request, *args, **kwargs). Concurrent misses of one
+    entry collapse into a single rebuild: the first request takes a lock in
+    the cache, the others wait for its result and only run the view
+    themselves if it takes longer than REBUILD_WAIT seconds. The lock lives
+    in the catalog cache, so this holds across worker processes only with a
+    shared backend; with the local-memory one it is per process.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = get_catalog_cache()
+            key = catalog_cache_key(
+                type(self).__name__, request.path, sorted(kwargs.items()), normalized_query(request)
+            )
+
+            lock_key = f'{key}:lock'
+            data = cache.get(key)
+            locked = False
+            if data is None:
+                locked = cache.add(lock_key, 1, timeout=REBUILD_LOCK_TIMEOUT)
+                if not locked:
+                    data = wait_for_entry(cache, key)
+            if data is not None:
+                _count(HITS_KEY)
+                return Response(data)
+
+            _count(MISSES_KEY)
+            try:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    entry_timeout = timeout(request, *args, **kwargs) if callable(timeout) else timeout
+                    cache.set(key, response.data, entry_timeout)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            return response
+        return wrapper
+    return decorator
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Strong ETag from the catalog version and everything that selects the representation"""
+    digest = hashlib.sha1(repr((
+        request.path,
+        normalized_query(request),
+        request.META.get('HTTP_ACCEPT', ''),
+        request.user.pk,
+    )).encode()).hexdigest()[:16]
+    return f'{get_catalog_version()}-{digest}'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(get_catalog_version(), tz=timezone.utc)
+
+
+def conditional_catalog_response(view_method=None, *, epoch=None):
+    """
+    Answer If-None-Match / If-Modified-Since on an APIView `get` method.
+
+    Validators come from the catalog version alone, so a 304 is returned
+    before the view queries the database or runs a serializer. Responses
+    that also change with the clock (effective prices as discounts start
+    and end) pass `epoch`, a callable taking the view arguments and
+    returning the last such change as a datetime or None; it is folded
+    into both validators.
+    """
+    if view_method is None:
+        return lambda view_method: conditional_catalog_response(view_method, epoch=epoch)
+
+    etag_func, last_modified_func = catalog_etag, catalog_last_modified
+    if epoch is not None:
+        def etag_func(request, *args, **kwargs):
+            etag = catalog_etag(request, *args, **kwargs)
+            moment = epoch(request, *args, **kwargs)
+            return f'{etag}-{int(moment.timestamp() * 10**6)}' if moment else etag
+
+        def last_modified_func(request, *args, **kwargs):
+            modified = catalog_last_modified(request, *args, **kwargs)
+            moment = epoch(request, *args, **kwargs)
+            if moment is None:
+                return modified
+            # Last-Modified has whole seconds; round up so the change is never hidden
+            moment = datetime.fromtimestamp(math.ceil(moment.timestamp()), tz=timezone.utc)
+            return max(modified, moment)
+
+    return method_decorator(
+        condition(etag_func=etag_func, last_modified_func=last_modified_func)
+    )(view_method)
@@ -0,0 +1,21 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+from .cache import CATALOG_CACHE_ALIAS, get_catalog_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_catalog_cache_is_shared(app_configs, **kwargs):
+    """The catalog versions and rebuild locks only work across processes in a shared cache"""
+    if not isinstance(get_catalog_cache(), LocMemCache):
+        return []
+    return [
+        Warning(
+            f"The '{CATALOG_CACHE_ALIAS}' cache is local to each process.",
+            hint=(
+                "Catalog writes will not invalidate the responses cached by other worker "
+                "processes. Set CATALOG_CACHE_URL to a Redis server."
+            ),
+            id='product.W001',
+        )
+    ]
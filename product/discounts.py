@@ -0,0 +1,431 @@
+"""
+Discount lookup for catalog pricing.
+
+DiscountIndex keeps the live discounts of this process in memory: every
+discount that is enabled and not cancelled, with its product and category
+links, plus its start and end dates in sorted lists. "Active at t" and
+"ending within delta" are answered by bisecting those lists, without
+touching the database. Discount writes refresh the affected entries when
+their transaction commits (see product.signals) and bump a shared version
+in the catalog cache; a process that sees a version it did not write itself
+reloads the whole index on its next lookup.
+
+DiscountResolver prices a batch of products against a set of active
+discounts indexed by product id, category id and global scope. Resolving a
+batch costs at most one query, for the category links of the batch. As in
+ProductDiscountsView, category discounts apply to the categories a product
+is directly assigned to.
+
+A discount's stored status is derived from its dates when it is saved and
+lags behind the clock, so activity is decided from the dates; only
+"cancelled" is taken from the status. sweep_discount_statuses() moves due
+discounts along (run it periodically with `manage.py sweep_discounts`) so
+that `status` stays usable as a database filter.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .cache import bump_discounts_version, get_discounts_version
+from .models import Discount, Product
+
+CENT = Decimal('0.01')
+
+# Sent after a sweep commits, once per transition, with discount_ids,
+# old_status, new_status and at (the sweep time)
+discount_status_changed = Signal()
+
+
+def live_discounts():
+    """Discounts that are, were or will be active: enabled and not cancelled"""
+    return Discount.objects.filter(is_active=True).exclude(status='cancelled')
+
+
+def active_discounts(now=None):
+    """Discounts that can be applied at `now`"""
+    now = now or timezone.now()
+    return live_discounts().filter(
+        start_date__lte=now,
+        end_date__gte=now
+    ).exclude(
+        Q(usage_limit__isnull=False) & Q(usage_count__gte=F('usage_limit'))
+    )
+
+
+# (old status, new status, filter selecting the discounts due at `now`),
+# mirroring the status rules of Discount.save()
+STATUS_TRANSITIONS = [
+    ('scheduled', 'active', lambda now: Q(is_active=True, start_date__lte=now, end_date__gte=now)),
+    ('scheduled', 'expired', lambda now: Q(end_date__lt=now)),
+    ('active', 'expired', lambda now: Q(end_date__lt=now)),
+]
+
+
+def sweep_discount_statuses(now=None):
+    """
+    Move due discounts to their current status with one UPDATE per transition.
+
+    Returns {(old status, new status): [discount ids]}; listeners of
+    discount_status_changed are notified once the transaction commits.
+    """
+    now = now or timezone.now()
+    changed = {}
+    with transaction.atomic():
+        for old_status, new_status, due in STATUS_TRANSITIONS:
+            # Lock the rows so concurrent sweeps do not report the same transition twice
+            discount_ids = list(
+                Discount.objects.select_for_update().filter(due(now), status=old_status)
+                .order_by().values_list('id', flat=True)
+            )
+            if not discount_ids:
+                continue
+            Discount.objects.filter(id__in=discount_ids).update(status=new_status, updated_at=now)
+            changed[old_status, new_status] = discount_ids
+
+        for (old_status, new_status), discount_ids in changed.items():
+            transaction.on_commit(partial(
+                discount_status_changed.send, sender=Discount, discount_ids=discount_ids,
+                old_status=old_status, new_status=new_status, at=now
+            ))
+    return changed
+
+
+def load_links(discount_ids):
+    """({discount id: product ids}, {discount id: category ids}) in two queries"""
+    products, categories = defaultdict(set), defaultdict(set)
+    if discount_ids:
+        for discount_id, product_id in Discount.products.through.objects.filter(
+            discount_id__in=discount_ids
+        ).values_list('discount_id', 'product_id'):
+            products[discount_id].add(product_id)
+        for discount_id, category_id in Discount.categories.through.objects.filter(
+            discount_id__in=discount_ids
+        ).values_list('discount_id', 'category_id'):
+            categories[discount_id].add(category_id)
+    return products, categories
+
+
+def is_exhausted(discount):
+    return discount.usage_limit is not None and discount.usage_count >= discount.usage_limit
+
+
+class DiscountIndex:
+    """
+    Process-local interval index of the live discounts; use the `discount_index` instance.
+
+    Redemptions only reload a discount once it runs out; other uses update
+    the usage_count of this process's cached instance when they commit, and
+    reach other processes with their next reload. Read it from the database
+    where it has to be exact.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._entries = {}  # id -> (discount, product ids, category ids)
+        self._starts = []   # sorted (start_date, id)
+        self._ends = []     # sorted (end_date, id)
+
+    def _add(self, discount, product_ids, category_ids):
+        self._entries[discount.id] = (discount, frozenset(product_ids), frozenset(category_ids))
+        insort(self._starts, (discount.start_date, discount.id))
+        insort(self._ends, (discount.end_date, discount.id))
+
+    def _remove(self, discount_id):
+        entry = self._entries.pop(discount_id, None)
+        if entry is not None:
+            discount = entry[0]
+            del self._starts[bisect_left(self._starts, (discount.start_date, discount_id))]
+            del self._ends[bisect_left(self._ends, (discount.end_date, discount_id))]
+
+    def rebuild(self):
+        """Reload every live discount; three queries"""
+        # Read the version first so a write during the load triggers another rebuild
+        version = get_discounts_version()
+        discounts = list(
+            live_discounts().filter(status__in=('scheduled', 'active'), end_date__gte=timezone.now()).order_by()
+        )
+        products, categories = load_links([discount.id for discount in discounts])
+        with self._lock:
+            self._entries, self._starts, self._ends = {}, [], []
+            for discount in discounts:
+                self._add(discount, products[discount.id], categories[discount.id])
+            self._version = version
+
+    def refresh(self, discount_ids=None):
+        """
+        Reload the given discounts (all of them when None) after they changed.
+
+        Called once the write has committed. Bumps the shared version; the
+        entries are patched in place only if this process was in sync with
+        the version before the bump, otherwise the next lookup rebuilds.
+        """
+        version = bump_discounts_version()
+        with self._lock:
+            in_sync = self._version is not None and version == self._version + 1
+            if discount_ids is None or not in_sync:
+                self._version = None
+                return
+
+        discount_ids = list(discount_ids)
+        discounts = list(live_discounts().filter(id__in=discount_ids).order_by())
+        products, categories = load_links([discount.id for discount in discounts])
+        with self._lock:
+            for discount_id in discount_ids:
+                self._remove(discount_id)
+            for discount in discounts:
+                self._add(discount, products[discount.id], categories[discount.id])
+            self._version = version
+
+    def _sync(self):
+        if self._version != get_discounts_version():
+            self.rebuild()
+
+    def get(self, discount_id):
+        """The live discount with this id, or None"""
+        self._sync()
+        entry = self._entries.get(discount_id)
+        return entry[0] if entry else None
+
+    def active_at(self, moment=None):
+        """Discounts that can be applied at `moment` (default: now)"""
+        moment = moment or timezone.now()
+        self._sync()
+        with self._lock:
+            started = bisect_right(self._starts, (moment, float('inf')))
+            ended = bisect_left(self._ends, (moment, float('-inf')))
+            # Scan whichever side of the interval test is shorter
+            if started <= len(self._ends) - ended:
+                discounts = [self._entries[discount_id][0] for _, discount_id in self._starts[:started]]
+                discounts = [discount for discount in discounts if discount.end_date >= moment]
+            else:
+                discounts = [self._entries[discount_id][0] for _, discount_id in self._ends[ended:]]
+                discounts = [discount for discount in discounts if discount.start_date <= moment]
+        return [discount for discount in discounts if not is_exhausted(discount)]
+
+    def ending_within(self, delta, moment=None):
+        """Discounts active at `moment` that end no later than `moment + delta`"""
+        moment = moment or timezone.now()
+        self._sync()
+        with self._lock:
+            window = self._ends[
+                bisect_left(self._ends, (moment, float('-inf'))):
+                bisect_right(self._ends, (moment + delta, float('inf')))
+            ]
+            discounts = [self._entries[discount_id][0] for _, discount_id in window]
+        return [
+            discount for discount in discounts
+            if discount.start_date <= moment and not is_exhausted(discount)
+        ]
+
+    def next_boundary(self, moment=None, lead=None):
+        """
+        Earliest time after `moment` at which a discount starts or ends, or
+        is `lead` away from ending; None when nothing changes any more.
+        """
+        moment = moment or timezone.now()
+        self._sync()
+        candidates = []
+        with self._lock:
+            index = bisect_right(self._starts, (moment, float('inf')))
+            if index < len(self._starts):
+                candidates.append(self._starts[index][0])
+            index = bisect_right(self._ends, (moment, float('inf')))
+            if index < len(self._ends):
+                candidates.append(self._ends[index][0])
+            if lead:
+                index = bisect_right(self._ends, (moment + lead, float('inf')))
+                if index < len(self._ends):
+                    candidates.append(self._ends[index][0] - lead)
+        return min(candidates, default=None)
+
+    def last_boundary(self, moment=None, lead=None):
+        """
+        Latest time up to `moment` at which a discount started or ended, or
+        was `lead` away from ending; None if there is none.
+        """
+        moment = moment or timezone.now()
+        self._sync()
+        candidates = []
+        with self._lock:
+            for dates in (self._starts, self._ends):
+                index = bisect_right(dates, (moment, float('inf')))
+                if index:
+                    candidates.append(dates[index - 1][0])
+            if lead:
+                index = bisect_right(self._ends, (moment + lead, float('inf')))
+                if index:
+                    candidates.append(self._ends[index - 1][0] - lead)
+        return max(candidates, default=None)
+
+    def boundaries(self):
+        """Every start and end date in the index, sorted"""
+        self._sync()
+        with self._lock:
+            return sorted({moment for moment, _ in self._starts} | {moment for moment, _ in self._ends})
+
+    def links(self, discount_id):
+        """(product ids, category ids) linked to the discount, empty if it is not in the index"""
+        with self._lock:
+            entry = self._entries.get(discount_id)
+        return (entry[1], entry[2]) if entry else (frozenset(), frozenset())
+
+    def note_usage(self, discount_id, usage_count):
+        """Record a committed redemption on the cached instance, without a reload"""
+        with self._lock:
+            entry = self._entries.get(discount_id)
+            if entry is not None and entry[0].usage_count < usage_count:
+                entry[0].usage_count = usage_count
+
+    def product_ids(self, discounts):
+        """Ids of the products linked directly to these discounts"""
+        ids = set()
+        with self._lock:
+            for discount in discounts:
+                entry = self._entries.get(discount.id)
+                if entry is not None:
+                    ids |= entry[1]
+        return ids
+
+    def resolver(self, moment=None):
+        """DiscountResolver over the discounts active at `moment`, without queries"""
+        discounts = self.active_at(moment)
+        with self._lock:
+            entries = [self._entries.get(discount.id) for discount in discounts]
+        entries = [entry for entry in entries if entry is not None]
+        return DiscountResolver(
+            [discount for discount, _, _ in entries],
+            [(discount.id, product_id) for discount, product_ids, _ in entries for product_id in product_ids],
+            [(discount.id, category_id) for discount, _, category_ids in entries for category_id in category_ids],
+        )
+
+    def check(self, moment=None):
+        """
+        Compare the index with the database at `moment` (default: now).
+
+        Discounts that had ended when the index was loaded are not indexed,
+        so `moment` should not be in the past.
+
+        Returns {'missing': ids, 'unexpected': ids, 'stale': ids}: active
+        discounts the index does not return, discounts it returns that the
+        ORM query does not, and live discounts that are missing from the
+        index or whose dates, links, usage limit or exhaustion differ from
+        the database (redemptions only refresh an entry when they exhaust
+        its discount, so usage counts below the limit may lag). All
+        lists are empty when consistent.
+        """
+        moment = moment or timezone.now()
+        expected = set(active_discounts(moment).values_list('id', flat=True))
+        actual = {discount.id for discount in self.active_at(moment)}
+
+        with self._lock:
+            entries = dict(self._entries)
+        rows = list(
+            live_discounts().filter(Q(id__in=list(entries)) | Q(end_date__gte=moment))
+            .values_list('id', 'start_date', 'end_date', 'usage_limit', 'usage_count')
+        )
+        products, categories = load_links([row[0] for row in rows])
+        stale = set(entries) - {row[0] for row in rows}
+        for discount_id, start_date, end_date, usage_limit, usage_count in rows:
+            if discount_id not in entries:
+                stale.add(discount_id)
+                continue
+            discount, product_ids, category_ids = entries[discount_id]
+            if (
+                (discount.start_date, discount.end_date, discount.usage_limit, is_exhausted(discount))
+                != (start_date, end_date, usage_limit, usage_limit is not None and usage_count >= usage_limit)
+                or product_ids != products[discount_id]
+                or category_ids != categories[discount_id]
+            ):
+                stale.add(discount_id)
+
+        return {
+            'missing': sorted(expected - actual),
+            'unexpected': sorted(actual - expected),
+            'stale': sorted(stale),
+        }
+
+
+discount_index = DiscountIndex()
+
+
+class DiscountResolver:
+    """Active discounts indexed by scope; build with `load()` or `discount_index.resolver()`"""
+
+    def __init__(self, discounts, product_links=(), category_links=()):
+        self.discounts = {discount.id: discount for discount in discounts}
+        self.by_product = defaultdict(list)
+        self.by_category = defaultdict(list)
+        self.global_discounts = [
+            discount for discount in self.discounts.values() if discount.apply_to_all_products
+        ]
+        for discount_id, product_id in product_links:
+            self.by_product[product_id].append(self.discounts[discount_id])
+        for discount_id, category_id in category_links:
+            self.by_category[category_id].append(self.discounts[discount_id])
+
+    @classmethod
+    def load(cls, now=None):
+        """Resolver straight from the database, in three queries"""
+        discounts = list(active_discounts(now).order_by())
+        products, categories = load_links([discount.id for discount in discounts])
+        return cls(
+            discounts,
+            [(discount_id, product_id) for discount_id, ids in products.items() for product_id in ids],
+            [(discount_id, category_id) for discount_id, ids in categories.items() for category_id in ids],
+        )
+
+    def applicable(self, product_id, category_ids=()):
+        """Discounts that apply to a product, each once"""
+        found = {discount.id: discount for discount in self.global_discounts}
+        for discount in self.by_product.get(product_id, ()):
+            found[discount.id] = discount
+        for category_id in category_ids:
+            for discount in self.by_category.get(category_id, ()):
+                found[discount.id] = discount
+        return list(found.values())
+
+    def best(self, product_id, price, category_ids=()):
+        """(discount, amount off one unit) of the largest discount, or (None, 0)"""
+        best, best_amount = None, Decimal(0)
+        for discount in self.applicable(product_id, category_ids):
+            amount = Decimal(discount.calculate_discount_amount(price)).quantize(CENT, rounding=ROUND_HALF_UP)
+            # Ties go to the oldest discount so the choice is stable
+            if amount > best_amount or (amount == best_amount and amount and discount.id < best.id):
+                best, best_amount = discount, amount
+        return best, best_amount
+
+    def category_ids(self, product_ids):
+        """{product id: [category ids]} in one query, skipped when no discount is category-scoped"""
+        categories = defaultdict(list)
+        if self.by_category and product_ids:
+            links = Product.categories.through.objects.filter(
+                product_id__in=product_ids
+            ).values_list('product_id', 'category_id')
+            for product_id, category_id in links:
+                categories[product_id].append(category_id)
+        return categories
+
+    def resolve(self, products):
+        """
+        Price a batch of products.
+
+        Returns {product id: (effective price, discount or None, amount off)}.
+        """
+        products = list(products)
+        if not self.discounts:
+            return {product.id: (product.price, None, Decimal(0)) for product in products}
+
+        categories = self.category_ids([product.id for product in products])
+        pricing = {}
+        for product in products:
+            discount, amount = self.best(product.id, product.price, categories.get(product.id, ()))
+            pricing[product.id] = (product.price - amount, discount, amount)
+        return pricing
@@ -0,0 +1,110 @@
+"""
+Streaming product export as JSON Lines or CSV.
+
+Products are read with `values()` through `QuerySet.iterator()`, so no model
+instances are built and only one chunk is held in memory at a time. Category
+slugs are fetched per chunk with a single query on the M2M table. The
+columns match what product.importer accepts, so an export can be imported
+again.
+"""
+import csv
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Product
+
+try:
+    import orjson
+except ImportError:  # optional speedup, falls back to the stdlib encoder
+    orjson = None
+
+EXPORT_CHUNK_SIZE = 2000
+# Bytes handed to the server per write
+BUFFER_SIZE = 64 * 1024
+
+EXPORT_FIELDS = [
+    'id', 'title', 'description', 'price', 'stock_quantity', 'is_active',
+    'average_rating', 'review_count', 'created_at', 'updated_at',
+]
+COLUMNS = EXPORT_FIELDS + ['categories']
+
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_products(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one dict per product, with `categories` as a list of slugs"""
+    rows = queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    Through = Product.categories.through
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        slugs = defaultdict(list)
+        links = (
+            Through.objects.filter(product_id__in=[row['id'] for row in chunk])
+            .order_by('product_id', 'category__slug')
+            .values_list('product_id', 'category__slug')
+        )
+        for product_id, slug in links:
+            slugs[product_id].append(slug)
+
+        for row in chunk:
+            row['categories'] = slugs.get(row['id'], [])
+            yield row
+
+
+class _Echo:
+    """File-like object whose write returns the value, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+class ExportEncoder(JSONEncoder):
+    # Prices stay exact strings, as in the API responses
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+def iter_jsonl(rows):
+    encoder = ExportEncoder()
+    for row in rows:
+        if orjson is not None:
+            yield orjson.dumps(row, default=encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME) + b'\n'
+        else:
+            yield encoder.encode(row).encode() + b'\n'
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS).encode()
+    for row in rows:
+        row['categories'] = '|'.join(row['categories'])
+        yield writer.writerow([row[column] for column in COLUMNS]).encode()
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def export_products(queryset, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Serialized export of `queryset` in `file_format` as an iterator of byte chunks"""
+    rows = iter_products(queryset, chunk_size)
+    return buffered(iter_jsonl(rows) if file_format == 'jsonl' else iter_csv(rows))
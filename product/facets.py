@@ -0,0 +1,61 @@
+"""
+Facet counts for the product list sidebar.
+
+Counts come from two aggregate queries however many facets there are: one
+GROUP BY over category slugs, and one conditional aggregate for the price
+histogram and stock state. Counts for the unfiltered catalog are cached
+under the catalog version, so any catalog write invalidates them.
+"""
+from django.db.models import Count, Q
+
+from .cache import catalog_cache_key, get_catalog_cache
+from .models import Product
+
+# Upper-open price bands: [0, 50), [50, 100), ..., [2500, inf)
+PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000, 2500]
+
+CATALOG_FACETS_TIMEOUT = 60 * 5
+
+
+def compute_facets(queryset):
+    """Return category, price and stock counts for the products in `queryset`"""
+    # Facet over the matching ids so filter joins cannot double count
+    products = Product.objects.filter(id__in=queryset.values('id'))
+
+    category_rows = (
+        products.filter(categories__isnull=False)
+        .values('categories__slug')
+        .annotate(count=Count('id', distinct=True))
+        .order_by('categories__slug')
+    )
+
+    bands = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+    aggregates = {
+        'in_stock': Count('id', filter=Q(stock_quantity__gt=0)),
+        'out_of_stock': Count('id', filter=Q(stock_quantity__lte=0)),
+    }
+    for index, (low, high) in enumerate(bands):
+        band = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'price_{index}'] = Count('id', filter=band)
+    totals = products.aggregate(**aggregates)
+
+    return {
+        'categories': {row['categories__slug']: row['count'] for row in category_rows},
+        'price': [
+            {'min': low, 'max': high, 'count': totals[f'price_{index}']}
+            for index, (low, high) in enumerate(bands)
+        ],
+        'in_stock': {
+            'true': totals['in_stock'],
+            'false': totals['out_of_stock'],
+        },
+    }
+
+
+def get_catalog_facets():
+    """Facet counts for every active product, served from the cache when possible"""
+    return get_catalog_cache().get_or_set(
+        catalog_cache_key('facets'),
+        lambda: compute_facets(Product.objects.filter(is_active=True)),
+        CATALOG_FACETS_TIMEOUT
+    )
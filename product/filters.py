@@ -1,17 +1,36 @@
 import django_filters
-from .models import Product
+from .models import Product, Category
+
+
+def filter_by_category_tree(queryset, slug):
+    """Products in the category with this slug or any of its subcategories"""
+    path = Category.objects.filter(slug=slug).values_list('path', flat=True).first()
+    if path is None:
+        return queryset.none()
+    
+    lower, upper = Category.subtree_range(path)
+    # Match through the M2M table so products in several subcategories are not duplicated
+    in_subtree = Product.categories.through.objects.filter(
+        category__path__gte=lower,
+        category__path__lt=upper
+    ).values('product_id')
+    return queryset.filter(id__in=in_subtree)
+
 
 class ProductFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name="price", lookup_expr='lte')
-    category = django_filters.CharFilter(field_name='categories__slug')
+    category = django_filters.CharFilter(method='filter_category')
     in_stock = django_filters.BooleanFilter(method='filter_in_stock')
     
     class Meta:
         model = Product
         fields = ['categories', 'min_price', 'max_price', 'in_stock']
     
+    def filter_category(self, queryset, name, value):
+        return filter_by_category_tree(queryset, value)
+    
     def filter_in_stock(self, queryset, name, value):
         if value:
             return queryset.filter(stock_quantity__gt=0)
-        return queryset
\ No newline at end of file
+        return queryset
@@ -0,0 +1,71 @@
+"""
+Background generation of ProductImage derivatives.
+
+Uploads are saved as-is; once the upload's transaction commits, the
+original is handed to a process pool that writes thumbnail and medium
+renditions (JPEG and WebP) with Pillow. The result is recorded on the
+ProductImage row when the worker finishes, so the upload request never
+waits for resizing.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache import bump_catalog_version
+from .imaging import generate_derivatives
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a threaded server process is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def schedule_derivatives(image_id, name):
+    """Queue derivative generation for one image and record the result when it is done"""
+    future = get_executor().submit(generate_derivatives, str(settings.MEDIA_ROOT), name)
+    future.add_done_callback(partial(_store_derivatives, image_id, name))
+    return future
+
+
+def _store_derivatives(image_id, name, future):
+    # Runs on the executor's callback thread, which has its own DB connection
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception("Could not generate derivatives for product image %s (%s)", image_id, name)
+        return
+
+    try:
+        save_derivatives(image_id, name, result)
+    finally:
+        close_old_connections()
+
+
+def save_derivatives(image_id, name, result):
+    # Skip if the image was replaced while the worker was running
+    updated = ProductImage.objects.filter(pk=image_id, image=name).update(
+        width=result['width'],
+        height=result['height'],
+        renditions=result['renditions'],
+    )
+    if updated:
+        bump_catalog_version()
+    return updated
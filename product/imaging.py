@@ -0,0 +1,58 @@
+"""
+Pillow image derivatives for product images.
+
+This module deliberately imports nothing from Django: its functions run in
+worker processes (see product.images) that never set Django up.
+"""
+import os
+import posixpath
+
+from PIL import Image, ImageOps
+
+# Longest side in pixels; images are never upscaled
+RENDITIONS = {
+    'thumbnail': 200,
+    'medium': 800,
+}
+
+FORMATS = [
+    # (key, Pillow format, extension, save options)
+    ('jpeg', 'JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+]
+
+
+def derivative_name(name, label, extension):
+    """products/phone.jpg -> products/derivatives/phone_thumbnail.webp"""
+    directory, filename = posixpath.split(name)
+    base, _ = posixpath.splitext(filename)
+    return posixpath.join(directory, 'derivatives', f'{base}_{label}.{extension}')
+
+
+def generate_derivatives(media_root, name):
+    """
+    Write every rendition of the image stored at `name` under `media_root`.
+
+    Returns the original's dimensions and, per rendition, its dimensions
+    and the storage names of its JPEG and WebP files.
+    """
+    with Image.open(os.path.join(media_root, name)) as original:
+        # Respect camera orientation, then drop alpha/palette for JPEG
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    width, height = image.size
+    renditions = {}
+    for label, longest_side in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail((longest_side, longest_side), Image.Resampling.LANCZOS)
+
+        rendition = {'width': resized.width, 'height': resized.height}
+        for key, image_format, extension, options in FORMATS:
+            output = derivative_name(name, label, extension)
+            path = os.path.join(media_root, output)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            resized.save(path, image_format, **options)
+            rendition[key] = output
+        renditions[label] = rendition
+
+    return {'width': width, 'height': height, 'renditions': renditions}
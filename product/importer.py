@@ -0,0 +1,152 @@
+"""
+Streaming bulk product import from CSV or JSON Lines.
+
+Rows are parsed one at a time and validated in batches. Each valid batch is
+written with one bulk INSERT for the products plus chunked INSERTs for their
+category rows, so memory stays flat whatever the file size. Bulk writes skip
+the model signals, so the search index, price history and catalog cache are
+updated here explicitly.
+
+CSV files need a header row; `categories` holds category slugs separated by
+"|". In JSON Lines, `categories` may also be a list of slugs.
+"""
+import codecs
+import csv
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import search
+from .cache import invalidate_catalog
+from .models import Category, PriceHistory, Product
+
+IMPORT_BATCH_SIZE = 1000
+THROUGH_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'jsonl')
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """Validates one import row; categories are slugs resolved by the importer"""
+    categories = serializers.ListField(child=serializers.SlugField(), required=False)
+
+    class Meta:
+        model = Product
+        fields = ['title', 'description', 'price', 'stock_quantity', 'is_active', 'categories']
+
+
+def guess_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return None
+
+
+def iter_rows(stream, file_format):
+    """Yield (row number, dict or None if unparseable) from a binary stream"""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            # Empty cells fall back to the model defaults
+            row = {key: value for key, value in row.items() if key and value not in ('', None)}
+            if 'categories' in row:
+                row['categories'] = [slug.strip() for slug in row['categories'].split('|') if slug.strip()]
+            yield number, row
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if isinstance(row, dict) and isinstance(row.get('categories'), str):
+            row['categories'] = [slug.strip() for slug in row['categories'].split('|') if slug.strip()]
+        yield number, row if isinstance(row, dict) else None
+
+
+class ProductImporter:
+    """Import products for one vendor; call `run` with a binary stream"""
+
+    def __init__(self, vendor, batch_size=IMPORT_BATCH_SIZE):
+        self.vendor = vendor
+        self.batch_size = batch_size
+        # One query for every slug a row may reference
+        self.category_ids = dict(Category.objects.filter(is_active=True).values_list('slug', 'id'))
+        self.validator = ProductImportSerializer()
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, number, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'errors': detail})
+
+    def validate(self, number, row):
+        if row is None:
+            self.add_error(number, {'non_field_errors': ['Row is not a valid JSON object.']})
+            return None
+        try:
+            data = self.validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            self.add_error(number, exc.detail)
+            return None
+
+        slugs = data.pop('categories', [])
+        unknown = [slug for slug in slugs if slug not in self.category_ids]
+        if unknown:
+            self.add_error(number, {'categories': [f"Unknown category: {slug}" for slug in unknown]})
+            return None
+        return Product(vendor=self.vendor, **data), {self.category_ids[slug] for slug in slugs}
+
+    def write(self, batch):
+        Through = Product.categories.through
+        with transaction.atomic():
+            products = Product.objects.bulk_create([product for product, _ in batch])
+            links = (
+                Through(product_id=product.id, category_id=category_id)
+                for product, category_ids in batch
+                for category_id in category_ids
+            )
+            chunk = []
+            for link in links:
+                chunk.append(link)
+                if len(chunk) == THROUGH_CHUNK_SIZE:
+                    Through.objects.bulk_create(chunk)
+                    chunk = []
+            if chunk:
+                Through.objects.bulk_create(chunk)
+
+            product_ids = [product.id for product in products]
+            search.index_products(product_ids)
+            PriceHistory.record_current_prices(product_ids, changed_by=self.vendor)
+            invalidate_catalog()
+        self.created += len(products)
+
+    def run(self, stream, file_format):
+        batch = []
+        for number, row in iter_rows(stream, file_format):
+            item = self.validate(number, row)
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
@@ -0,0 +1,111 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product import search
+from product.models import Category, Product
+
+VOCABULARY = (
+    "phone smart pro max mini ultra wireless charger cable case screen glass "
+    "laptop gaming keyboard mouse monitor headphones earbuds speaker bluetooth "
+    "camera lens tripod watch band fitness tracker tablet stylus cover stand "
+    "black white silver gold blue red green titanium leather metal plastic "
+    "fast portable compact premium original new used refurbished edition"
+).split()
+
+CATEGORY_NAMES = ["Phones", "Laptops", "Audio", "Cameras", "Wearables", "Accessories"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the FTS5 search index with the icontains search on synthetic "
+        "catalogs. Data is created inside a transaction and rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+        # Broad words match a large share of the catalog; "x42" is a selective model-code prefix
+        parser.add_argument("--queries", nargs="+", default=["phone", "wireless charger", "titan", "x42"])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        if not search.search_index_available():
+            raise CommandError("The full-text search index requires SQLite with FTS5")
+
+        rng = random.Random(42)
+        self.stdout.write(
+            f"{'products':>10}  {'query':<18} {'matches':>8}  "
+            f"{'page: icontains':>15} {'fts5':>8}  {'all: icontains':>14} {'fts5':>8}  (ms)"
+        )
+        for size in options["sizes"]:
+            with transaction.atomic():
+                self.seed(size, rng, options["batch_size"])
+                search.rebuild_index()
+                for query in options["queries"]:
+                    self.compare(size, query, options["repeat"], options["page_size"])
+                transaction.set_rollback(True)
+
+    def seed(self, size, rng, batch_size):
+        vendor = get_user_model().objects.create_user(
+            username="benchmark-vendor", email="benchmark@example.com", user_type="vendor"
+        )
+        categories = [
+            Category.objects.create(name=name, slug=f"benchmark-{name.lower()}")
+            for name in CATEGORY_NAMES
+        ]
+        through = Product.categories.through
+
+        for start in range(0, size, batch_size):
+            products = Product.objects.bulk_create([
+                Product(
+                    title=" ".join(rng.choices(VOCABULARY, k=rng.randint(3, 6)) + [f"x{rng.randint(0, 99_999)}"]),
+                    description=" ".join(rng.choices(VOCABULARY, k=rng.randint(20, 40))),
+                    price=Decimal(rng.randint(100, 500_000)) / 100,
+                    stock_quantity=rng.randint(0, 50),
+                    vendor=vendor,
+                )
+                for _ in range(min(batch_size, size - start))
+            ])
+            through.objects.bulk_create([
+                through(product_id=product.id, category_id=rng.choice(categories).id)
+                for product in products
+            ])
+
+    def compare(self, size, query, repeat, page_size):
+        products = Product.objects.filter(is_active=True)
+
+        def icontains_search(limit):
+            queryset = search.icontains_search(products, query).order_by("-created_at", "-id")
+            return list(queryset.values_list("id", flat=True)[:limit])
+
+        def fts_search(limit):
+            queryset = search.search_products(products, query).order_by("search_rank", "id")
+            return list(queryset.values_list("id", flat=True)[:limit])
+
+        matches = search.search_products(products, query).count()
+        timings = [
+            self.timed(lambda: icontains_search(page_size), repeat),
+            self.timed(lambda: fts_search(page_size), repeat),
+            self.timed(lambda: icontains_search(None), repeat),
+            self.timed(lambda: fts_search(None), repeat),
+        ]
+        self.stdout.write(
+            f"{size:>10}  {query:<18} {matches:>8}  "
+            f"{timings[0]:>15.2f} {timings[1]:>8.2f}  {timings[2]:>14.2f} {timings[3]:>8.2f}"
+        )
+
+    def timed(self, func, repeat):
+        """Best-of-N wall time in milliseconds"""
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from product.discounts import discount_index
+
+
+class Command(BaseCommand):
+    help = "Compare the in-memory discount index with the ORM query for active discounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--at", action="append", default=[],
+            help="ISO datetime to check besides now; may be repeated"
+        )
+        parser.add_argument(
+            "--boundaries", action="store_true",
+            help="Also check just before, at and just after every upcoming start and end date"
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        moments = [now]
+        for value in options["at"]:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise CommandError(f"Not an ISO datetime: {value}")
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            moments.append(moment)
+
+        if options["boundaries"]:
+            step = timedelta(microseconds=1)
+            for boundary in discount_index.boundaries():
+                moments += [boundary - step, boundary, boundary + step]
+
+        # The index does not hold discounts that ended before it was loaded
+        moments = sorted({moment for moment in moments if moment >= now})
+        failures = 0
+        for moment in moments:
+            report = discount_index.check(moment)
+            if any(report.values()):
+                failures += 1
+                self.stderr.write(f"{moment.isoformat()}: {report}")
+        if failures:
+            raise CommandError(f"Discount index disagrees with the database at {failures} of {len(moments)} moments")
+        self.stdout.write(self.style.SUCCESS(f"Discount index consistent at {len(moments)} moments"))
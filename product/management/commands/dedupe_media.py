@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product.models import MediaBlob
+from product.storage import content_addressed_fields, is_content_addressed, media_storage
+
+
+class Command(BaseCommand):
+    help = "Move files saved before content-addressed storage into it, sharing identical copies"
+
+    def handle(self, *args, **options):
+        moved = shared = missing = 0
+        for model, field in content_addressed_fields():
+            names = set(
+                model._default_manager.exclude(**{field.name: ""})
+                .exclude(**{f"{field.name}__isnull": True})
+                .values_list(field.name, flat=True)
+            )
+
+            for old_name in sorted(name for name in names if not is_content_addressed(name)):
+                if not media_storage.exists(old_name):
+                    missing += 1
+                    self.stderr.write(f"{model._meta.label}.{field.name}: {old_name} is missing")
+                    continue
+
+                with media_storage.open(old_name) as content:
+                    new_name = media_storage.save(old_name, content)
+                shared += new_name in names
+                names.add(new_name)
+
+                # Bulk update on purpose: the references are recounted below
+                with transaction.atomic():
+                    model._default_manager.filter(**{field.name: old_name}).update(**{field.name: new_name})
+                media_storage.delete(old_name)
+                moved += 1
+
+        with transaction.atomic():
+            MediaBlob.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} files ({shared} duplicates of stored content, {missing} missing)"
+        ))
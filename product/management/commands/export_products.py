@@ -0,0 +1,39 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from product.export import CONTENT_TYPES, EXPORT_CHUNK_SIZE, export_products
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream products as JSON Lines or CSV to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--vendor", help="Only this vendor's products (username)")
+        parser.add_argument("--file-format", choices=list(CONTENT_TYPES), default="jsonl")
+        parser.add_argument("-o", "--output", help="Output path (default: stdout)")
+        parser.add_argument(
+            "--chunk-size", type=int, default=EXPORT_CHUNK_SIZE,
+            help="Products fetched per query"
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options["vendor"]:
+            try:
+                vendor = get_user_model().objects.get(username=options["vendor"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['vendor']}")
+            products = products.filter(vendor=vendor)
+
+        chunks = export_products(products, options["file_format"], options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,90 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from product.imaging import FORMATS, RENDITIONS, derivative_name
+from product.models import MediaBlob
+from product.storage import content_addressed_fields, is_content_addressed, media_storage
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed media files that no model references any more"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours", type=float, default=24,
+            help="Only collect blobs unreferenced and untouched for this long"
+        )
+        parser.add_argument(
+            "--reconcile", action="store_true",
+            help="Recount references from the file fields before collecting"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="List what would be deleted without deleting it"
+        )
+
+    def handle(self, *args, **options):
+        fields = content_addressed_fields()
+        if options["reconcile"]:
+            with transaction.atomic():
+                changed = MediaBlob.reconcile()
+            self.stdout.write(f"Reconciled {changed} reference counts")
+
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        candidates = set(
+            MediaBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff)
+            .values_list("name", flat=True)
+        )
+        # Files without a MediaBlob row, e.g. written by an upload whose transaction rolled back
+        known = set(MediaBlob.objects.values_list("name", flat=True))
+        candidates |= {name for name in self.stored_names(fields, cutoff) if name not in known}
+
+        garbage = sorted(candidates - self.referenced(fields, candidates))
+        deleted = 0
+        for name in garbage:
+            path = media_storage.path(name)
+            # A re-upload of the same content touches the file (see ContentAddressedStorage)
+            if os.path.exists(path) and os.path.getmtime(path) >= cutoff.timestamp():
+                continue
+            deleted += 1
+            if options["dry_run"]:
+                self.stdout.write(name)
+                continue
+            for label in RENDITIONS:
+                for _, _, extension, _ in FORMATS:
+                    media_storage.delete(derivative_name(name, label, extension))
+            media_storage.delete(name)
+            MediaBlob.objects.filter(name=name, refcount__lte=0).delete()
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} unreferenced blobs"))
+
+    def stored_names(self, fields, cutoff):
+        """Content-addressed files on disk, removing upload temp files left by crashes"""
+        directories = {field.upload_to for _, field in fields if isinstance(field.upload_to, str)}
+        for directory in directories:
+            root = media_storage.path(directory)
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if d != "derivatives"]
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    name = os.path.relpath(path, media_storage.location).replace("\\", "/")
+                    if is_content_addressed(name):
+                        yield name
+                    elif filename.startswith(".upload-") and os.path.getmtime(path) < cutoff.timestamp():
+                        os.unlink(path)
+
+    def referenced(self, fields, names, chunk_size=500):
+        names = list(names)
+        found = set()
+        for model, field in fields:
+            for start in range(0, len(names), chunk_size):
+                found.update(
+                    model._default_manager.filter(**{f"{field.name}__in": names[start:start + chunk_size]})
+                    .values_list(field.name, flat=True)
+                )
+        return found
@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from product.images import save_derivatives
+from product.imaging import generate_derivatives
+from product.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/medium/WebP derivatives for existing product images in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Worker processes (default: one per CPU)"
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Regenerate derivatives that already exist"
+        )
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image="")
+        if not options["all"]:
+            images = images.filter(renditions={})
+        pending = list(images.values_list("id", "image").order_by("id"))
+
+        media_root = str(settings.MEDIA_ROOT)
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {
+                executor.submit(generate_derivatives, media_root, name): (image_id, name)
+                for image_id, name in pending
+            }
+            for future in as_completed(futures):
+                image_id, name = futures[future]
+                try:
+                    save_derivatives(image_id, name, future.result())
+                    done += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{name}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated derivatives for {done} images ({failed} failed)"
+        ))
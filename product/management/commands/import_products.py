@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importer import FORMATS, IMPORT_BATCH_SIZE, ProductImporter, guess_format
+
+
+class Command(BaseCommand):
+    help = "Bulk import products for a vendor from a CSV or JSON Lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON Lines file")
+        parser.add_argument("--vendor", required=True, help="Username of the owning vendor")
+        parser.add_argument("--file-format", choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument(
+            "--batch-size", type=int, default=IMPORT_BATCH_SIZE,
+            help="Rows validated and inserted per transaction"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            vendor = get_user_model().objects.get(username=options["vendor"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['vendor']}")
+        if not vendor.is_vendor:
+            raise CommandError(f"{vendor.username} is not a vendor")
+
+        file_format = options["file_format"] or guess_format(options["path"])
+        if file_format not in FORMATS:
+            raise CommandError("Could not tell the file format, pass --file-format")
+
+        importer = ProductImporter(vendor, batch_size=options["batch_size"])
+        with open(options["path"], "rb") as stream:
+            report = importer.run(stream, file_format)
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        if report["errors_truncated"]:
+            self.stderr.write(f"... {report['failed'] - len(report['errors'])} more failed rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} products ({report['failed']} rows failed)"
+        ))
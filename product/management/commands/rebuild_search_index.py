@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index from the product table"
+
+    def handle(self, *args, **options):
+        if not search.search_index_available():
+            raise CommandError("The full-text search index requires SQLite with FTS5")
+
+        with transaction.atomic():
+            count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product.models import Discount, DiscountUsageDaily
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily discount usage rollup from the DiscountUsage table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1_000,
+            help="Number of discounts (by id range) recomputed per transaction"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = Discount.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+        written = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                written += DiscountUsageDaily.rebuild(
+                    Discount.objects.filter(id__gt=start, id__lte=start + batch_size)
+                )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily discount usage rows"))
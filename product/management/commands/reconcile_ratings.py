@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating aggregates on Product from the reviews table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10_000,
+            help="Number of products (by id range) recomputed per transaction"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = Product.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += Product.rebuild_rating_stats(
+                    Product.objects.filter(id__gt=start, id__lte=start + batch_size)
+                )
+        self.stdout.write(self.style.SUCCESS(f"Reconciled rating aggregates for {updated} products"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.discounts import sweep_discount_statuses
+
+
+class Command(BaseCommand):
+    help = "Move due discounts from scheduled to active and from active to expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float,
+            help="Keep running and sweep every this many seconds (default: sweep once and exit)"
+        )
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        while True:
+            changed = sweep_discount_statuses()
+            for (old_status, new_status), discount_ids in changed.items():
+                self.stdout.write(f"{old_status} -> {new_status}: {len(discount_ids)} discounts")
+            if interval is None:
+                if not changed:
+                    self.stdout.write("No discounts were due")
+                break
+            time.sleep(interval)
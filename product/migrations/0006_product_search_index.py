@@ -0,0 +1,79 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:33
+
+import django.db.models.deletion
+import product.models
+from django.db import migrations, models
+
+CREATE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+    title, description, categories,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# Default `rank` column: bm25 weighted title > categories > description
+RANK_SQL = """
+INSERT INTO product_search(product_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')
+"""
+
+POPULATE_SQL = """
+INSERT INTO product_search(rowid, title, description, categories)
+SELECT p.id, p.title, p.description, (
+    SELECT COALESCE(group_concat(c.name, ' '), '') FROM product_category c
+    JOIN product_product_categories pc ON pc.category_id = c.id
+    WHERE pc.product_id = p.id
+)
+FROM product_product p WHERE p.is_active
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends fall back to icontains search
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(RANK_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0005_product_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchIndex",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="product.product",
+                    ),
+                ),
+                ("title", models.TextField()),
+                ("description", models.TextField()),
+                ("categories", models.TextField()),
+                ("document", product.models.FullTextField(db_column="product_search")),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "product_search",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    Review = apps.get_model("product", "Review")
+    reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+
+    def from_reviews(aggregate):
+        return Coalesce(Subquery(reviews.annotate(value=aggregate).values("value")), 0)
+
+    updates = {
+        "rating_sum": from_reviews(Sum("rating")),
+        "review_count": from_reviews(Count("id")),
+    }
+    for rating in range(1, 6):
+        updates[f"rating_{rating}_count"] = from_reviews(
+            Count("id", filter=Q(rating=rating))
+        )
+    Product.objects.update(**updates)
+    Product.objects.update(
+        average_rating=Coalesce(
+            Cast(F("rating_sum"), FloatField()) / NullIf(F("review_count"), 0),
+            Value(0.0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0006_product_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="average_rating",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["average_rating", "id"], name="product_pro_average_bd4c4d_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
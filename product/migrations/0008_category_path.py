@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+def backfill_category_paths(apps, schema_editor):
+    Category = apps.get_model("product", "Category")
+    categories = list(Category.objects.only("id", "parent_id"))
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+
+    # Walk down from the roots so every parent path is known before its children
+    stack = [(category, "") for category in children.get(None, [])]
+    while stack:
+        category, parent_path = stack.pop()
+        category.path = f"{parent_path}{category.id}/"
+        stack.extend((child, category.path) for child in children.get(category.id, []))
+    Category.objects.bulk_update(categories, ["path"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0007_product_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="path",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(backfill_category_paths, migrations.RunPython.noop),
+    ]
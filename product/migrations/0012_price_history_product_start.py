@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_initial_price_history(apps, schema_editor):
+    # Products without any history get an open row at their current price
+    Product = apps.get_model("product", "Product")
+    PriceHistory = apps.get_model("product", "PriceHistory")
+    products = Product.objects.filter(price_history__isnull=True).values_list(
+        "id", "price", "created_at"
+    )
+    PriceHistory.objects.bulk_create(
+        [
+            PriceHistory(
+                product_id=product_id, original_price=price, start_date=created_at
+            )
+            for product_id, price, created_at in products.iterator(chunk_size=2000)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0011_media_blob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pricehistory",
+            index=models.Index(
+                fields=["product", "start_date"], name="product_pri_product_442f57_idx"
+            ),
+        ),
+        migrations.RunPython(open_initial_price_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0012_price_history_product_start"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="discount",
+            index=models.Index(
+                fields=["status", "start_date", "end_date"],
+                name="product_dis_status_1807d3_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_usage(apps, schema_editor):
+    DiscountUsage = apps.get_model("product", "DiscountUsage")
+    DiscountUsageDaily = apps.get_model("product", "DiscountUsageDaily")
+    rows = (
+        DiscountUsage.objects.annotate(day=TruncDate("used_at"))
+        .values("discount_id", "discount__created_by_id", "day")
+        .annotate(uses=Count("order_id", distinct=True), given=Sum("discount_amount"), revenue=Sum("original_price"))
+        .order_by()
+    )
+    DiscountUsageDaily.objects.bulk_create(
+        [
+            DiscountUsageDaily(
+                discount_id=row["discount_id"],
+                vendor_id=row["discount__created_by_id"],
+                day=row["day"],
+                uses=row["uses"],
+                discount_given=row["given"],
+                revenue_affected=row["revenue"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("order", "0004_order_discount_order_discount_amount"),
+        ("product", "0013_discount_status_dates"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DiscountUsageDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("uses", models.PositiveIntegerField(default=0)),
+                (
+                    "discount_given",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "revenue_affected",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Discount usage daily",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="discountusage",
+            index=models.Index(
+                fields=["used_at", "id"], name="product_dis_used_at_46b418_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="discountusage",
+            index=models.Index(
+                fields=["discount", "used_at", "id"],
+                name="product_dis_discoun_7d8e27_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="discountusagedaily",
+            name="discount",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_usage",
+                to="product.discount",
+            ),
+        ),
+        migrations.AddField(
+            model_name="discountusagedaily",
+            name="vendor",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="discount_usage_daily",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="discountusagedaily",
+            index=models.Index(
+                fields=["vendor", "day"], name="product_dis_vendor__d79106_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="discountusagedaily",
+            unique_together={("discount", "day")},
+        ),
+        migrations.RunPython(backfill_daily_usage, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Substr, TruncDate
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from .cache import invalidate_price_series
+from .storage import content_addressed_fields, is_content_addressed, media_storage
+
 User = settings.AUTH_USER_MODEL
 
 class Product(models.Model):
@@ -30,19 +35,157 @@ class Product(models.Model):
         limit_choices_to={'user_type': 'vendor'},  # Only vendor users can have products
     )
 
+    #rating aggregates (maintained from Review signals, see update_rating_stats)
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination keys (see pagination.ProductCursorPagination)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['average_rating', 'id']),
+        ]
+
+    # Only written by update_rating_stats and rebuild_rating_stats
+    RATING_STATS_FIELDS = frozenset({
+        'rating_sum', 'review_count', 'average_rating',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    })
+
+    def save(self, *args, **kwargs):
+        """
+        Saving an existing product never writes the rating aggregates.
+
+        The instance holds the aggregates as they were when it was loaded;
+        writing them back would undo F()-expression updates from reviews
+        posted in the meantime.
+        """
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [name for name in update_fields if name not in self.RATING_STATS_FIELDS]
+        super().save(*args, **kwargs)
+
     def is_in_stock(self):
         return self.stock_quantity > 0
     
     def __str__(self):
         return self.title
 
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
+
+    @classmethod
+    def update_rating_stats(cls, product_id, added=None, removed=None):
+        """Apply one review's rating change in a single UPDATE using F-expressions"""
+        count_delta = (added is not None) - (removed is not None)
+        sum_delta = (added or 0) - (removed or 0)
+
+        histogram = {}
+        if added is not None:
+            histogram[added] = histogram.get(added, 0) + 1
+        if removed is not None:
+            histogram[removed] = histogram.get(removed, 0) - 1
+
+        updates = {
+            f'rating_{rating}_count': F(f'rating_{rating}_count') + delta
+            for rating, delta in histogram.items() if delta
+        }
+        if count_delta or sum_delta:
+            new_sum = F('rating_sum') + sum_delta
+            new_count = F('review_count') + count_delta
+            updates['rating_sum'] = new_sum
+            updates['review_count'] = new_count
+            # SET expressions see the old row, so the average is derived from the same deltas
+            updates['average_rating'] = Coalesce(
+                Cast(new_sum, models.FloatField()) / NullIf(new_count, 0),
+                Value(0.0)
+            )
+
+        if updates:
+            cls.objects.filter(pk=product_id).update(**updates)
+
+    @classmethod
+    def rebuild_rating_stats(cls, queryset=None):
+        """Recompute rating aggregates from the reviews table with set-based UPDATEs"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+
+        def from_reviews(aggregate):
+            return Coalesce(Subquery(reviews.annotate(value=aggregate).values('value')), 0)
+
+        updates = {
+            'rating_sum': from_reviews(Sum('rating')),
+            'review_count': from_reviews(Count('id')),
+        }
+        for rating in range(1, 6):
+            updates[f'rating_{rating}_count'] = from_reviews(Count('id', filter=Q(rating=rating)))
+
+        updated = queryset.update(**updates)
+        queryset.update(average_rating=Coalesce(
+            Cast(F('rating_sum'), models.FloatField()) / NullIf(F('review_count'), 0),
+            Value(0.0)
+        ))
+        return updated
+
+
+class FullTextField(models.TextField):
+    """The FTS5 hidden column named after its table, only used for MATCH queries"""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductSearchIndex(models.Model):
+    """Read-only view of the FTS5 `product_search` table, maintained by product.search"""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+    )
+    title = models.TextField()
+    description = models.TextField()
+    categories = models.TextField()
+    document = FullTextField(db_column='product_search')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'product_search'
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=media_storage)
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
     order = models.IntegerField(default=0)
+    # Filled in by the background derivative pipeline (see product.images)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     class Meta:
         ordering = ['order', 'id']
@@ -60,6 +203,11 @@ class Review(models.Model):
     
     class Meta:
         unique_together = ['product', 'user'] 
+        indexes = [
+            # Per-product keyset pagination (see pagination.ReviewCursorPagination)
+            models.Index(fields=['product', 'created_at', 'id']),
+            models.Index(fields=['product', 'rating', 'id']),
+        ]
 
 
 class Category(models.Model):
@@ -67,16 +215,56 @@ class Category(models.Model):
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
-    image = models.ImageField(upload_to='categories/', null=True, blank=True)
+    image = models.ImageField(upload_to='categories/', storage=media_storage, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     order = models.IntegerField(default=0)  
     
+    # Materialized path of ancestor ids, e.g. "1/5/12/" (maintained in save())
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['order', 'name']
     
     def __str__(self):
         return self.name
+    
+    @staticmethod
+    def subtree_range(path):
+        """(lower, upper) bounds selecting `path` and all its descendants with an index range scan"""
+        # Paths end in "/" and ids are digits, which all sort after "/"
+        return path, path[:-1] + '0'
+    
+    def get_descendants(self, include_self=True):
+        lower, upper = self.subtree_range(self.path)
+        descendants = Category.objects.filter(path__gte=lower, path__lt=upper)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+    
+    def clean(self):
+        if self.pk and self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            if parent_path.startswith(self.path):
+                raise ValidationError("A category cannot be moved under itself or one of its subcategories")
+    
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        super().save(*args, **kwargs)
+        
+        parent_path = self.parent.path if self.parent_id else ''
+        new_path = f'{parent_path}{self.pk}/'
+        if new_path == old_path:
+            return
+        
+        Category.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            # Reparented: rewrite the prefix of every descendant in one UPDATE
+            lower, upper = self.subtree_range(old_path)
+            Category.objects.filter(path__gte=lower, path__lt=upper).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1))
+            )
+        self.path = new_path
 
 
 class Discount(models.Model):
@@ -132,6 +320,10 @@ class Discount(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Status sweeps and status-filtered lookups (see discounts.sweep_discount_statuses)
+            models.Index(fields=['status', 'start_date', 'end_date']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_discount_type_display()})"
@@ -169,9 +361,10 @@ class Discount(models.Model):
     def is_currently_active(self):
         """Check if discount is currently active"""
         now = timezone.now()
+        # The stored status only changes on save, so go by the dates
         return (self.is_active and 
                 self.start_date <= now <= self.end_date and 
-                self.status == 'active' and
+                self.status != 'cancelled' and
                 (self.usage_limit is None or self.usage_count < self.usage_limit))
     
     def calculate_discount_amount(self, product_price, quantity=1):
@@ -225,6 +418,10 @@ class PriceHistory(models.Model):
     class Meta:
         ordering = ['-start_date']
         verbose_name_plural = "Price Histories"
+        indexes = [
+            # Per-product date-range lookups (see PriceHistoryView)
+            models.Index(fields=['product', 'start_date']),
+        ]
     
     def __str__(self):
         return f"{self.product.title} - {self.original_price} ({self.start_date})"
@@ -247,6 +444,39 @@ class PriceHistory(models.Model):
         now = timezone.now()
         return (self.start_date <= now and 
                 (self.end_date is None or self.end_date >= now))
+    
+    @classmethod
+    def record_current_prices(cls, product_ids, changed_by=None, at=None, chunk_size=500):
+        """
+        Close the open history row of each product and open one at its current price.
+        
+        Call after the new prices are saved. Per chunk of products this is one
+        UPDATE and one INSERT ... SELECT from the product table, so no model
+        instances are built however many products changed.
+        """
+        at = at or timezone.now()
+        product_ids = list(product_ids)
+        
+        meta, product_meta = cls._meta, Product._meta
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(meta.get_field(name).column) for name in (
+            'product', 'original_price', 'start_date', 'created_at', 'created_by'
+        ))
+        timestamp = meta.get_field('start_date').get_db_prep_save(at, connection)
+        changed_by_id = getattr(changed_by, 'pk', changed_by)
+        
+        with connection.cursor() as cursor:
+            for start in range(0, len(product_ids), chunk_size):
+                chunk = product_ids[start:start + chunk_size]
+                cls.objects.filter(product_id__in=chunk, end_date__isnull=True).update(end_date=at)
+                cursor.execute(
+                    f"INSERT INTO {quote(meta.db_table)} ({columns}) "
+                    f"SELECT {quote(product_meta.pk.column)}, {quote(product_meta.get_field('price').column)}, %s, %s, %s "
+                    f"FROM {quote(product_meta.db_table)} "
+                    f"WHERE {quote(product_meta.pk.column)} IN ({', '.join(['%s'] * len(chunk))})",
+                    [timestamp, timestamp, changed_by_id, *chunk]
+                )
+        invalidate_price_series(product_ids)
 
 class DiscountUsage(models.Model):
     """Track usage of discounts"""
@@ -264,7 +494,140 @@ class DiscountUsage(models.Model):
     class Meta:
         ordering = ['-used_at']
         unique_together = ['discount', 'order', 'product']
+        indexes = [
+            # Keyset pagination of usage listings (see pagination.DiscountUsageCursorPagination)
+            models.Index(fields=['used_at', 'id']),
+            models.Index(fields=['discount', 'used_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.discount.name} - {self.user.username} - ${self.discount_amount}"
 
+
+class DiscountUsageDaily(models.Model):
+    """Daily totals of DiscountUsage per discount, kept up to date as usages are recorded"""
+    discount = models.ForeignKey(Discount, on_delete=models.CASCADE, related_name='daily_usage')
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='discount_usage_daily')
+    day = models.DateField()
+    
+    uses = models.PositiveIntegerField(default=0)
+    discount_given = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sum of the original prices of the lines the discount was applied to
+    revenue_affected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['-day']
+        verbose_name_plural = "Discount usage daily"
+        unique_together = ['discount', 'day']
+        indexes = [
+            # Vendor dashboards over a date range
+            models.Index(fields=['vendor', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.discount_id} - {self.day}: {self.uses} uses"
+    
+    @classmethod
+    def record_usages(cls, usages, vendor_id):
+        """
+        Add freshly created DiscountUsage rows of one vendor to the daily totals.
+        
+        `uses` counts orders, like Discount.usage_count (see product.redemption).
+        Per discount and day this is one INSERT of an empty row if there is
+        none yet and one UPDATE with F-expressions, so concurrent redemptions
+        never lose each other's counts.
+        """
+        totals, orders = {}, set()
+        for usage in usages:
+            key = (usage.discount_id, timezone.localdate(usage.used_at))
+            uses, given, revenue = totals.get(key, (0, 0, 0))
+            if (usage.discount_id, usage.order_id) not in orders:
+                orders.add((usage.discount_id, usage.order_id))
+                uses += 1
+            totals[key] = (uses, given + usage.discount_amount, revenue + usage.original_price)
+        if not totals:
+            return
+        
+        cls.objects.bulk_create(
+            [cls(discount_id=discount_id, vendor_id=vendor_id, day=day) for discount_id, day in totals],
+            ignore_conflicts=True
+        )
+        for (discount_id, day), (uses, given, revenue) in totals.items():
+            cls.objects.filter(discount_id=discount_id, day=day).update(
+                uses=F('uses') + uses,
+                discount_given=F('discount_given') + given,
+                revenue_affected=F('revenue_affected') + revenue,
+            )
+    
+    @classmethod
+    def rebuild(cls, discounts=None):
+        """
+        Recompute the daily totals of `discounts` (default: all) from DiscountUsage.
+        
+        Picks up usages that were deleted or written around record_usages().
+        Returns the number of rollup rows written.
+        """
+        if discounts is None:
+            discounts = Discount.objects.all()
+        rows = (
+            DiscountUsage.objects.filter(discount__in=discounts)
+            .annotate(day=TruncDate('used_at'))
+            .values('discount_id', 'discount__created_by_id', 'day')
+            .annotate(uses=Count('order_id', distinct=True), given=Sum('discount_amount'), revenue=Sum('original_price'))
+            .order_by()
+        )
+        rollups = [
+            cls(
+                discount_id=row['discount_id'], vendor_id=row['discount__created_by_id'], day=row['day'],
+                uses=row['uses'], discount_given=row['given'], revenue_affected=row['revenue'],
+            )
+            for row in rows
+        ]
+        cls.objects.filter(discount__in=discounts).delete()
+        cls.objects.bulk_create(rollups, batch_size=500)
+        return len(rollups)
+
+
+class MediaBlob(models.Model):
+    """Reference count of one file in the content-addressed media storage (see product.storage)"""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+    @classmethod
+    def adjust_references(cls, name, delta):
+        """Add `delta` references to `name` in a single UPDATE, creating the row if needed"""
+        if not name or not delta:
+            return
+        if delta > 0:
+            cls.objects.bulk_create([cls(name=name)], ignore_conflicts=True)
+        cls.objects.filter(name=name).update(refcount=F('refcount') + delta, updated_at=timezone.now())
+
+    @classmethod
+    def reconcile(cls):
+        """Recount every reference from the file fields; returns the number of rows changed"""
+        counts = {}
+        for model, field in content_addressed_fields():
+            rows = (
+                model._default_manager.exclude(**{field.name: ''}).order_by()
+                .values_list(field.name).annotate(count=Count('pk'))
+            )
+            for name, count in rows:
+                if is_content_addressed(name):
+                    counts[name] = counts.get(name, 0) + count
+
+        now = timezone.now()
+        changed = []
+        for blob in cls.objects.only('id', 'name', 'refcount'):
+            count = counts.pop(blob.name, 0)
+            if blob.refcount != count:
+                blob.refcount, blob.updated_at = count, now
+                changed.append(blob)
+        cls.objects.bulk_update(changed, ['refcount', 'updated_at'], batch_size=500)
+        cls.objects.bulk_create(
+            [cls(name=name, refcount=count) for name, count in counts.items()], batch_size=500
+        )
+        return len(changed) + len(counts)
@@ -0,0 +1,177 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination with opaque cursors.
+
+    Pages are ordered on one of the supported fields with `id` as a tiebreaker,
+    and each page starts strictly after the (value, id) of the previous page's
+    edge row, so deep pages cost the same as the first one and inserts never
+    shift rows between pages.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = '-created_at'
+
+    # Supported ordering fields and how to read their value back from a cursor
+    ordering_fields = {
+        'created_at': parse_datetime,
+    }
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+
+        # Walking backwards flips both the comparison and the sort direction
+        walk_descending = descending != reverse
+        if cursor:
+            strict, inclusive = ('lt', 'lte') if walk_descending else ('gt', 'gte')
+            value, pk = cursor['value'], cursor['id']
+            # The inclusive bound lets the database range-scan the (field, id) index
+            queryset = queryset.filter(
+                Q(**{f'{field}__{inclusive}': value}),
+                Q(**{f'{field}__{strict}': value}) | Q(**{f'id__{strict}': pk})
+            )
+
+        prefix = '-' if walk_descending else ''
+        queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') in self.ordering_fields:
+            return ordering
+        return self.default_ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.build_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.build_link(self.page[0], reverse=True)
+
+    def build_link(self, instance, reverse):
+        field = self.ordering.lstrip('-')
+        value = getattr(instance, field)
+        payload = {
+            'o': self.ordering,
+            'v': value.isoformat() if hasattr(value, 'isoformat') else str(value),
+            'id': instance.pk,
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.ordering_query_param, self.ordering)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """Return the decoded cursor for this request, or None for the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            ordering, value, pk = payload['o'], payload['v'], payload['id']
+            # Well-formed JSON can still carry anything; the parsers below expect strings
+            if not (isinstance(ordering, str) and isinstance(value, str) and isinstance(pk, int)):
+                raise TypeError
+            parse = self.ordering_fields[ordering.lstrip('-')]
+            value = parse(value)
+            reverse = bool(payload['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError, InvalidOperation):
+            raise NotFound(self.invalid_cursor_message)
+
+        # A cursor is only meaningful for the ordering it was issued for
+        if value is None or ordering != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+
+        return {'value': value, 'id': pk, 'reverse': reverse}
+
+
+class ProductCursorPagination(KeysetCursorPagination):
+    """Cursor pagination for product listings"""
+    ordering_fields = {
+        'created_at': parse_datetime,
+        'price': Decimal,
+        'average_rating': float,
+    }
+
+
+class ProductSearchPagination(ProductCursorPagination):
+    """Cursor pagination for full-text results, most relevant first by default"""
+    default_ordering = 'search_rank'
+    ordering_fields = {
+        **ProductCursorPagination.ordering_fields,
+        'search_rank': float,
+    }
+
+
+class ReviewCursorPagination(KeysetCursorPagination):
+    """Cursor pagination for a product's reviews, newest first by default"""
+    page_size = 10
+    ordering_fields = {
+        'created_at': parse_datetime,
+        'rating': int,
+    }
+
+
+class DiscountUsageCursorPagination(KeysetCursorPagination):
+    """Cursor pagination for discount usage, newest first by default"""
+    default_ordering = '-used_at'
+    ordering_fields = {
+        'used_at': parse_datetime,
+    }
@@ -0,0 +1,194 @@
+"""
+Cart pricing with line and order discounts, in Decimal.
+
+Every line gets at most one line discount: the one requested for it, or
+else the best active discount that applies to the product (the one listing
+pages show as effective_price). One order discount may then be taken off
+the lines it covers, after their line discounts.
+
+- percentage: that share of the line total (of the covered lines' total
+  for an order discount)
+- fixed: that amount off each unit on a line, once for an order discount
+- buy_x_get_y: every (x + y)th group of units gets y units free; line
+  discounts only
+
+A discount with min_order_amount only applies when the cart subtotal
+reaches it, and max_discount_amount caps what one discount takes off the
+whole cart. Amounts are rounded half up to cents per line.
+
+Products are loaded with one `in_bulk` query and their category links with
+at most one more; discounts come from the in-memory discount index.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from .discounts import CENT, discount_index
+from .models import Product
+
+ZERO = Decimal('0.00')
+
+
+def line_discount_amount(discount, unit_price, quantity):
+    """What `discount` takes off a line, before min_order_amount and max_discount_amount"""
+    line_total = unit_price * quantity
+    if discount.discount_type == 'percentage':
+        amount = line_total * discount.percentage / 100
+    elif discount.discount_type == 'fixed':
+        amount = discount.fixed_amount * quantity
+    elif discount.discount_type == 'buy_x_get_y':
+        amount = (quantity // (discount.buy_quantity + discount.get_quantity)) * discount.get_quantity * unit_price
+    else:
+        amount = ZERO
+    return min(amount, line_total).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def order_discount_amount(discount, total):
+    """What an order discount takes off the `total` of the lines it covers"""
+    if discount.discount_type == 'percentage':
+        amount = total * discount.percentage / 100
+    else:
+        amount = discount.fixed_amount
+    return min(amount, total).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def meets_minimum(discount, subtotal):
+    return discount.min_order_amount is None or subtotal >= discount.min_order_amount
+
+
+class CartPricer:
+    """Price one cart; `price()` returns the breakdown"""
+
+    def __init__(self, items, discount_id=None, now=None, line_discounts=True):
+        # items: [{"product_id", "quantity", optional "discount_id"}]
+        self.items = items
+        self.discount_id = discount_id
+        # False: only discounts requested per line, no automatic best discount
+        self.line_discounts = line_discounts
+        self.resolver = discount_index.resolver(now)
+        self.unapplied = []
+        # What each discount may still take off the cart under max_discount_amount
+        self.budgets = {}
+
+    def skip(self, discount_id, reason, product_id=None):
+        entry = {'discount_id': discount_id, 'reason': reason}
+        if product_id is not None:
+            entry['product_id'] = product_id
+        self.unapplied.append(entry)
+
+    def capped(self, discount, amount):
+        if discount.max_discount_amount is None:
+            return amount
+        budget = self.budgets.setdefault(discount.id, discount.max_discount_amount)
+        amount = min(amount, budget)
+        self.budgets[discount.id] = budget - amount
+        return amount
+
+    def load_products(self):
+        """{id: product} of the active products in the cart, and the ids that are missing"""
+        product_ids = [item['product_id'] for item in self.items]
+        products = Product.objects.filter(is_active=True).only('id', 'title', 'price').in_bulk(product_ids)
+        return products, [product_id for product_id in product_ids if product_id not in products]
+
+    def line_discount(self, line, applicable, subtotal):
+        """(discount, amount) for one line"""
+        requested = line['requested_discount_id']
+        if requested is not None:
+            discount = applicable.get(requested)
+            if discount is None:
+                self.skip(requested, "Discount is not active or does not apply to this product", line['product_id'])
+            elif not meets_minimum(discount, subtotal):
+                self.skip(requested, f"Order subtotal is below {discount.min_order_amount}", line['product_id'])
+            else:
+                return discount, line_discount_amount(discount, line['unit_price'], line['quantity'])
+            return None, ZERO
+        if not self.line_discounts:
+            return None, ZERO
+
+        best, best_amount = None, ZERO
+        for discount in applicable.values():
+            if discount.id == self.discount_id or not meets_minimum(discount, subtotal):
+                continue
+            amount = line_discount_amount(discount, line['unit_price'], line['quantity'])
+            # Ties go to the oldest discount, as on listing pages
+            if amount > best_amount or (amount == best_amount and amount and discount.id < best.id):
+                best, best_amount = discount, amount
+        return best, best_amount
+
+    def price(self):
+        """Breakdown dict, or raise LookupError with the ids of missing products"""
+        products, missing = self.load_products()
+        if missing:
+            raise LookupError(missing)
+
+        categories = self.resolver.category_ids(list(products))
+        lines, applicable = [], {}
+        for item in self.items:
+            product = products[item['product_id']]
+            lines.append({
+                'product_id': product.id,
+                'title': product.title,
+                'quantity': item['quantity'],
+                'unit_price': product.price,
+                'line_total': product.price * item['quantity'],
+                'requested_discount_id': item.get('discount_id'),
+            })
+            applicable[product.id] = {
+                discount.id: discount
+                for discount in self.resolver.applicable(product.id, categories.get(product.id, ()))
+            }
+        subtotal = sum((line['line_total'] for line in lines), ZERO)
+
+        for line in lines:
+            discount, amount = self.line_discount(line, applicable[line['product_id']], subtotal)
+            line['discount'] = discount
+            line['discount_amount'] = self.capped(discount, amount) if discount else ZERO
+            line['order_discount_amount'] = ZERO
+
+        order_discount, order_amount = self.order_discount(lines, applicable, subtotal)
+
+        for line in lines:
+            line['total'] = line['line_total'] - line['discount_amount'] - line['order_discount_amount']
+            del line['requested_discount_id']
+        line_discounts = sum((line['discount_amount'] for line in lines), ZERO)
+        return {
+            'items': lines,
+            'subtotal': subtotal,
+            'line_discounts': line_discounts,
+            'order_discount': order_discount,
+            'order_discount_amount': order_amount,
+            'discount_total': line_discounts + order_amount,
+            'total': subtotal - line_discounts - order_amount,
+            'unapplied_discounts': self.unapplied,
+        }
+
+    def order_discount(self, lines, applicable, subtotal):
+        """Apply the order discount and spread it over the covered lines; (discount, amount)"""
+        if self.discount_id is None:
+            return None, ZERO
+        covered = [line for line in lines if self.discount_id in applicable[line['product_id']]]
+        if not covered:
+            self.skip(self.discount_id, "Discount is not active or applies to none of the products")
+            return None, ZERO
+        discount = applicable[covered[0]['product_id']][self.discount_id]
+        if discount.discount_type == 'buy_x_get_y':
+            self.skip(self.discount_id, "Buy X Get Y discounts apply to single products only")
+            return None, ZERO
+        if not meets_minimum(discount, subtotal):
+            self.skip(self.discount_id, f"Order subtotal is below {discount.min_order_amount}")
+            return None, ZERO
+
+        remaining = {id(line): line['line_total'] - line['discount_amount'] for line in covered}
+        amount = self.capped(discount, order_discount_amount(discount, sum(remaining.values(), ZERO)))
+
+        # Proportional shares per line for DiscountUsage rows; the largest line takes the rounding remainder
+        covered.sort(key=lambda line: remaining[id(line)])
+        base, allocated = sum(remaining.values(), ZERO), ZERO
+        for line in covered[:-1]:
+            share = (amount * remaining[id(line)] / base).quantize(CENT, rounding=ROUND_HALF_UP) if base else ZERO
+            line['order_discount_amount'] = share
+            allocated += share
+        covered[-1]['order_discount_amount'] = amount - allocated
+        return discount, amount
+
+
+def price_cart(items, discount_id=None, now=None, line_discounts=True):
+    return CartPricer(items, discount_id, now, line_discounts).price()
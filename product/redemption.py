@@ -0,0 +1,114 @@
+"""
+Discount redemption with enforced usage limits.
+
+A use is one redemption of a discount for one order, however many lines
+or units the discount covers there. A redemption takes its use with a
+single conditional UPDATE,
+
+    usage_count = usage_count + 1 WHERE usage_count + 1 <= usage_limit
+
+and writes one DiscountUsage row per order line with a bulk INSERT in the
+same transaction; the rows record the amounts, not the uses. The database
+serializes concurrent UPDATEs of the discount row and re-checks the
+condition, so however many checkouts race for the last uses, a limited
+discount is never redeemed past its limit. Comparing usage_count with
+usage_limit after a read, as Discount.is_currently_active does, cannot
+guarantee that. The usages are added to the DiscountUsageDaily rollup in
+the same transaction.
+
+Checkout (order.serializers.OrderCreateSerializer) prices an order
+discount the customer chose with product.pricing and redeems it through
+redeem_cart_discounts().
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .discounts import discount_index, live_discounts
+from .models import Discount, DiscountUsage, DiscountUsageDaily
+
+
+class DiscountUnavailable(Exception):
+    """The discount is not active, or has no uses left"""
+
+
+def redeem_discount(discount_id, order, lines, user=None, now=None):
+    """
+    Redeem a discount for the lines of an order, taking one use.
+
+    `lines` are (product id, original price, discount amount) triples, one
+    per order line and at most one per product; call this once per order
+    and discount. Either every line is recorded or, when the discount is
+    inactive or used up, nothing is and DiscountUnavailable is raised.
+    Returns the created DiscountUsage rows.
+    """
+    lines = list(lines)
+    if not lines:
+        return []
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        redeemed = live_discounts().filter(
+            Q(usage_limit__isnull=True) | Q(usage_limit__gt=F('usage_count')),
+            pk=discount_id,
+            start_date__lte=now,
+            end_date__gte=now,
+        ).update(usage_count=F('usage_count') + 1)
+        if not redeemed:
+            raise DiscountUnavailable(f"Discount {discount_id} is not active or has no uses left")
+
+        usages = DiscountUsage.objects.bulk_create([
+            DiscountUsage(
+                discount_id=discount_id,
+                order=order,
+                user=user or order.user,
+                product_id=product_id,
+                original_price=original_price,
+                discount_amount=discount_amount,
+                final_price=original_price - discount_amount,
+            )
+            for product_id, original_price, discount_amount in lines
+        ])
+
+        usage_count, usage_limit, vendor_id = Discount.objects.filter(pk=discount_id).values_list(
+            'usage_count', 'usage_limit', 'created_by_id'
+        ).get()
+        DiscountUsageDaily.record_usages(usages, vendor_id)
+
+        # Only running out changes what the catalog shows; other uses just
+        # update this process's copy in the discount index
+        if usage_limit is not None and usage_count >= usage_limit:
+            transaction.on_commit(lambda: discount_index.refresh([discount_id]))
+            invalidate_catalog()
+        else:
+            transaction.on_commit(lambda: discount_index.note_usage(discount_id, usage_count))
+    return usages
+
+
+def redeem_cart_discounts(order, breakdown, user=None, now=None):
+    """
+    Redeem every discount applied in a product.pricing breakdown for `order`.
+
+    A line discount records the line total as the original price; the order
+    discount records what was left of each covered line after its line
+    discount. Discounts are redeemed in id order so concurrent checkouts
+    lock the discount rows in the same order. Raises DiscountUnavailable
+    for the first discount that cannot be redeemed; the caller's
+    transaction then rolls back the uses already taken.
+    """
+    lines = {}
+    for item in breakdown['items']:
+        if item['discount'] is not None and item['discount_amount']:
+            lines.setdefault(item['discount'].id, []).append(
+                (item['product_id'], item['line_total'], item['discount_amount'])
+            )
+        if item['order_discount_amount']:
+            lines.setdefault(breakdown['order_discount'].id, []).append(
+                (item['product_id'], item['line_total'] - item['discount_amount'], item['order_discount_amount'])
+            )
+    return [
+        usage
+        for discount_id in sorted(lines)
+        for usage in redeem_discount(discount_id, order, lines[discount_id], user=user, now=now)
+    ]
@@ -0,0 +1,119 @@
+"""
+Full-text product search backed by an SQLite FTS5 index.
+
+`product_search` holds one row per active product (rowid = product id) with
+its title, description and category names, and is exposed to the ORM as the
+unmanaged `ProductSearchIndex` model. It is kept in sync by the
+handlers in `product.signals` and can be rebuilt from scratch with
+`manage.py rebuild_search_index`. On databases without FTS5 the helpers
+fall back to the old `icontains` filter.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+
+SEARCH_TABLE = 'product_search'
+
+CATEGORY_NAMES_SQL = (
+    "SELECT COALESCE(group_concat(c.name, ' '), '') FROM product_category c "
+    "JOIN product_product_categories pc ON pc.category_id = c.id "
+    "WHERE pc.product_id = p.id"
+)
+INDEX_SQL = (
+    f'INSERT INTO {SEARCH_TABLE}(rowid, title, description, categories) '
+    f'SELECT p.id, p.title, p.description, ({CATEGORY_NAMES_SQL}) '
+    f'FROM product_product p WHERE p.is_active'
+)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def search_index_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    Returns None when the query has no searchable words.
+    """
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_products(queryset, query):
+    """
+    Restrict a Product queryset to matches for `query`.
+
+    Results are annotated with `search_rank` (bm25, lower is more relevant) so
+    callers can order by relevance.
+    """
+    # Without an index every match ranks the same
+    no_rank = Value(0.0, output_field=FloatField())
+    if not search_index_available():
+        return icontains_search(queryset, query).annotate(search_rank=no_rank)
+
+    match = build_match_expression(query)
+    if match is None:
+        return queryset.none().annotate(search_rank=no_rank)
+
+    # Joins the index on rowid; `rank` is bm25 weighted title > categories > description
+    return queryset.filter(
+        search_index__document__match=match
+    ).annotate(
+        search_rank=F('search_index__rank')
+    )
+
+
+def icontains_search(queryset, query):
+    """The unindexed substring search the index replaces (kept for fallback and benchmarks)"""
+    return queryset.filter(
+        Q(title__icontains=query) |
+        Q(description__icontains=query) |
+        Q(categories__name__icontains=query)
+    ).distinct()
+
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+def index_products(product_ids):
+    """Rewrite the index rows for the given products (inactive ones are dropped)"""
+    if not search_index_available():
+        return
+
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), CHUNK_SIZE):
+            chunk = product_ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(f'{INDEX_SQL} AND p.id IN ({placeholders})', chunk)
+
+
+def unindex_products(product_ids):
+    if not search_index_available():
+        return
+
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), CHUNK_SIZE):
+            chunk = product_ids[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+
+def rebuild_index():
+    """Drop every index row and re-index all active products in one statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(INDEX_SQL)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
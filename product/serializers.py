@@ -1,9 +1,45 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from .models import Product, ProductImage, Review, Category, Discount, PriceHistory, DiscountUsage
+from .discounts import discount_index
+from .assignment import MODES
+from .filters import ProductFilter
+from decimal import Decimal, InvalidOperation
 from django.conf import settings
+from django.urls import reverse
 
 User = settings.AUTH_USER_MODEL
 
+def get_field_selection(request):
+    """Parse ?fields=a,b and ?exclude=c into (set of fields or None, set to exclude)"""
+    def parse(param):
+        value = request.query_params.get(param) if request is not None else None
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+    
+    return parse('fields'), parse('exclude') or set()
+
+class SparseFieldsMixin:
+    """Drop fields not selected with ?fields= / ?exclude= so they are never computed"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Views pass the parsed selection rather than the request, which would turn image URLs absolute
+        fields, exclude = self.context.get('field_selection', (None, set()))
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or name in exclude:
+                self.fields.pop(name)
+    
+    @classmethod
+    def selected_fields(cls, request):
+        """Field names that will be rendered for this request"""
+        fields, exclude = get_field_selection(request)
+        names = set(cls.Meta.fields)
+        if fields is not None:
+            names &= fields
+        return names - exclude
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -18,21 +54,55 @@ class CategoryTreeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'image', 'is_active', 'order', 'children']
     
     def get_children(self, obj):
-        children = obj.children.filter(is_active=True)
-        return CategoryTreeSerializer(children, many=True).data
+        if 'children' in self.context:
+            children = self.context['children'].get(obj.id, [])
+        else:
+            children = obj.children.filter(is_active=True)
+        return CategoryTreeSerializer(children, many=True, context=self.context).data
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    srcset_webp = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'image_url', 'alt_text', 'is_primary', 'order']
-        read_only_fields = ['id']
+        fields = [
+            'id', 'image', 'image_url', 'thumbnail_url', 'srcset', 'srcset_webp',
+            'width', 'height', 'alt_text', 'is_primary', 'order'
+        ]
+        read_only_fields = ['id', 'width', 'height']
     
     def get_image_url(self, obj):
         if obj.image:
             return obj.image.url
         return None
+    
+    def get_thumbnail_url(self, obj):
+        thumbnail = obj.renditions.get('thumbnail')
+        if thumbnail:
+            return obj.image.storage.url(thumbnail['jpeg'])
+        return self.get_image_url(obj)
+    
+    def _srcset(self, obj, key):
+        # Empty until the derivatives are generated; clients fall back to image_url
+        if not obj.image or not obj.renditions:
+            return None
+        storage = obj.image.storage
+        candidates = [
+            f"{storage.url(rendition[key])} {rendition['width']}w"
+            for rendition in sorted(obj.renditions.values(), key=lambda r: r['width'])
+        ]
+        if key == 'jpeg' and obj.width:
+            candidates.append(f"{obj.image.url} {obj.width}w")
+        return ', '.join(candidates)
+    
+    def get_srcset(self, obj):
+        return self._srcset(obj, 'jpeg')
+    
+    def get_srcset_webp(self, obj):
+        return self._srcset(obj, 'webp')
 
 class ReviewSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
@@ -57,44 +127,86 @@ class ReviewSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     primary_image = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
     categories = CategorySerializer(many=True, read_only=True)
     is_in_stock = serializers.BooleanField(read_only=True)
+    effective_price = serializers.SerializerMethodField()
+    applied_discount = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
-            'id', 'title', 'price', 'primary_image', 'average_rating',
-            'review_count', 'categories', 'stock_quantity', 'is_in_stock',
+            'id', 'title', 'price', 'effective_price', 'applied_discount', 'primary_image',
+            'average_rating', 'review_count', 'categories', 'stock_quantity', 'is_in_stock',
             'is_active', 'created_at'
         ]
         read_only_fields = ['id', 'created_at']
     
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None):
+        """Prefetch the relations of the selected fields so a list costs a fixed number of queries"""
+        fields = cls.selected_fields(request)
+        prefetches = []
+        if 'categories' in fields:
+            prefetches.append('categories')
+        if 'primary_image' in fields:
+            prefetches.append(Prefetch(
+                'images',
+                queryset=ProductImage.objects.filter(is_primary=True),
+                to_attr='primary_images'
+            ))
+        # The description is never listed and is by far the widest column
+        return queryset.defer('description').prefetch_related(*prefetches)
+    
     def get_primary_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
+        # Use the prefetched primary images when the view set them up
+        if hasattr(obj, 'primary_images'):
+            primary_image = obj.primary_images[0] if obj.primary_images else None
+        else:
+            primary_image = obj.images.filter(is_primary=True).first()
         if primary_image:
             return ProductImageSerializer(primary_image).data
         return None
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
+    def _pricing(self, obj):
+        # The whole page is resolved on first use and shared through the context
+        pricing = self.context.get('discount_pricing')
+        if pricing is None or obj.id not in pricing:
+            resolver = self.context.get('discount_resolver')
+            if resolver is None:
+                resolver = self.context['discount_resolver'] = discount_index.resolver()
+            products = self.parent.instance if isinstance(self.parent, serializers.ListSerializer) else [obj]
+            pricing = self.context['discount_pricing'] = resolver.resolve(products)
+        return pricing[obj.id]
     
-    def get_review_count(self, obj):
-        return obj.reviews.count()
+    def get_effective_price(self, obj):
+        effective_price, _, _ = self._pricing(obj)
+        return f"{effective_price:.2f}"
+    
+    def get_applied_discount(self, obj):
+        _, discount, amount = self._pricing(obj)
+        if discount is None:
+            return None
+        return {
+            'id': discount.id,
+            'name': discount.name,
+            'discount_type': discount.discount_type,
+            'discount_display': discount.get_discount_display(),
+            'amount': f"{amount:.2f}",
+        }
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Only the newest reviews are embedded; the rest come from ProductReviewListView
+    REVIEWS_PREVIEW_SIZE = 5
+    
     images = ProductImageSerializer(many=True, read_only=True)
-    reviews = ReviewSerializer(many=True, read_only=True)
+    reviews = serializers.SerializerMethodField()
+    reviews_url = serializers.SerializerMethodField()
     categories = CategorySerializer(many=True, read_only=True)
     vendor_name = serializers.CharField(source='vendor.get_full_name', read_only=True)
     average_rating = serializers.SerializerMethodField()
-    review_count = serializers.SerializerMethodField()
+    rating_histogram = serializers.ReadOnlyField()
     is_in_stock = serializers.BooleanField(read_only=True)
     
     class Meta:
@@ -102,19 +214,28 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'price', 'categories',
             'stock_quantity', 'is_active', 'is_in_stock', 'vendor',
-            'vendor_name', 'images', 'reviews', 'average_rating',
-            'review_count', 'created_at', 'updated_at'
+            'vendor_name', 'images', 'reviews', 'reviews_url', 'average_rating',
+            'review_count', 'rating_histogram', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'review_count', 'created_at', 'updated_at']
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
-        return 0
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None):
+        """Join or prefetch only the relations of the selected fields"""
+        fields = cls.selected_fields(request)
+        if 'vendor_name' in fields:
+            queryset = queryset.select_related('vendor')
+        return queryset.prefetch_related(*({'images', 'categories'} & fields))
     
-    def get_review_count(self, obj):
-        return obj.reviews.count()
+    def get_reviews(self, obj):
+        reviews = obj.reviews.select_related('user').order_by('-created_at', '-id')
+        return ReviewSerializer(reviews[:self.REVIEWS_PREVIEW_SIZE], many=True).data
+    
+    def get_reviews_url(self, obj):
+        return reverse('product-reviews', kwargs={'product_id': obj.id})
+    
+    def get_average_rating(self, obj):
+        return round(obj.average_rating, 1)
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     categories = serializers.PrimaryKeyRelatedField(
@@ -155,6 +276,63 @@ class ProductImageCreateSerializer(serializers.ModelSerializer):
         validated_data['product'] = self.context['product']
         return super().create(validated_data)
 
+class BulkRepriceSerializer(serializers.Serializer):
+    """Either `prices` ([{"id", "price"}, ...]) or a `category` + `percent` rule"""
+    prices = serializers.ListField(child=serializers.JSONField(), required=False, allow_empty=False)
+    category = serializers.SlugField(required=False)
+    percent = serializers.DecimalField(
+        max_digits=7, decimal_places=2, min_value=Decimal('-99.99'), max_value=Decimal('1000'),
+        required=False
+    )
+    
+    def validate_prices(self, value):
+        # Plain loop instead of a nested serializer: lists can hold 100k pairs
+        prices, errors = {}, {}
+        for index, item in enumerate(value):
+            try:
+                product_id = int(item['id'])
+                price = Decimal(str(item['price'])).quantize(Decimal('0.01'))
+                if not price.is_finite():
+                    raise InvalidOperation
+            except (TypeError, KeyError, ValueError, InvalidOperation):
+                errors[index] = "Expected {\"id\": <int>, \"price\": <decimal>}."
+                continue
+            if not Decimal(0) <= price <= Decimal('99999999.99'):
+                errors[index] = "Price must be between 0 and 99999999.99."
+            elif product_id in prices:
+                errors[index] = f"Product {product_id} is listed more than once."
+            else:
+                prices[product_id] = price
+        if errors:
+            raise serializers.ValidationError(errors)
+        return prices
+    
+    def validate(self, data):
+        has_rule = 'category' in data or 'percent' in data
+        if ('prices' in data) == has_rule:
+            raise serializers.ValidationError("Send either 'prices' or 'category' and 'percent'.")
+        if has_rule and not ('category' in data and 'percent' in data):
+            raise serializers.ValidationError("A rule needs both 'category' and 'percent'.")
+        return data
+
+class CartItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=10000)
+    discount_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+class CartPricingSerializer(serializers.Serializer):
+    """A cart to price: `items` plus an optional order-level `discount_id`"""
+    items = CartItemSerializer(many=True, allow_empty=False, max_length=500)
+    discount_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    
+    def validate_items(self, value):
+        seen = set()
+        for item in value:
+            if item['product_id'] in seen:
+                raise serializers.ValidationError(f"Product {item['product_id']} is listed more than once.")
+            seen.add(item['product_id'])
+        return value
+
 #----------------------DIscount and Price History Serializers----------------------#
 
 class DiscountSerializer(serializers.ModelSerializer):
@@ -172,7 +350,8 @@ class DiscountSerializer(serializers.ModelSerializer):
             'is_currently_active', 'discount_display', 'products_count',
             'created_by', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['usage_count', 'status', 'created_by']
+        # Product and category links are written set-based by the views (see product.assignment)
+        read_only_fields = ['usage_count', 'status', 'created_by', 'products', 'categories']
     
     def get_products_count(self, obj):
         if obj.apply_to_all_products:
@@ -204,6 +383,50 @@ class DiscountSerializer(serializers.ModelSerializer):
         
         return data
 
+class LiveDiscountSerializer(DiscountSerializer):
+    """
+    Discounts served from the discount index, with their links taken from
+    the index rather than the database. usage_count is approximate: uses
+    made through other processes show once this one reloads the discount.
+    """
+    products = serializers.SerializerMethodField()
+    categories = serializers.SerializerMethodField()
+    
+    def get_products(self, obj):
+        return sorted(discount_index.links(obj.id)[0])
+    
+    def get_categories(self, obj):
+        return sorted(discount_index.links(obj.id)[1])
+    
+    def get_products_count(self, obj):
+        if obj.apply_to_all_products:
+            return "All Products"
+        return len(discount_index.links(obj.id)[0])
+
+class DiscountAssignmentSerializer(serializers.Serializer):
+    """Products and categories to link a discount to; see product.assignment"""
+    products = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=100_000)
+    categories = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=10_000)
+    # ProductFilter parameters, e.g. {"category": "phones", "max_price": 100}
+    filter = serializers.DictField(required=False, allow_empty=False)
+    mode = serializers.ChoiceField(choices=MODES, default='add')
+    
+    def validate_filter(self, value):
+        filterset = ProductFilter(data=value, queryset=Product.objects.none())
+        unknown = set(value) - set(filterset.filters)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown filters: {', '.join(sorted(unknown))}. Use: {', '.join(filterset.filters)}."
+            )
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        return value
+    
+    def validate(self, data):
+        if not any(field in data for field in ('products', 'categories', 'filter')):
+            raise serializers.ValidationError("Give products, categories or a filter.")
+        return data
+
 class PriceHistorySerializer(serializers.ModelSerializer):
     discount_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     discount_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
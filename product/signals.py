@@ -0,0 +1,247 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Category, Discount, MediaBlob, PriceHistory, Product, ProductImage, Review
+from . import search
+from .cache import invalidate_catalog, invalidate_price_series
+from .discounts import discount_index, discount_status_changed
+from .images import schedule_derivatives
+from .storage import content_addressed_fields
+
+
+#--------------------Search index sync----------------------#
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    # Soft-deleted products (is_active=False) are dropped from the index here
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.unindex_products([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def reindex_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # Changed from the category side: pk_set holds product ids
+        if action == 'pre_clear':
+            instance._search_product_ids = list(instance.product_set.values_list('id', flat=True))
+        elif action == 'post_clear':
+            search.index_products(getattr(instance, '_search_product_ids', []))
+        elif action in ('post_add', 'post_remove'):
+            search.index_products(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        search.index_products([instance.pk])
+
+
+@receiver(post_init, sender=Category)
+def remember_category_name(sender, instance, **kwargs):
+    instance._search_name = instance.name
+
+
+@receiver(post_save, sender=Category)
+def reindex_renamed_category(sender, instance, created, raw=False, **kwargs):
+    if created or raw or instance.name == instance._search_name:
+        return
+    instance._search_name = instance.name
+    search.index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def collect_category_products(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_category_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, '_search_product_ids', []))
+
+
+#--------------------Rating aggregates----------------------#
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # What the product aggregates currently count for this review (None if unsaved)
+    instance._stats_rating = instance.rating if instance.pk else None
+    instance._stats_product_id = instance.product_id if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def update_rating_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    old_rating, old_product_id = instance._stats_rating, instance._stats_product_id
+    if created or old_product_id is None:
+        Product.update_rating_stats(instance.product_id, added=instance.rating)
+    elif old_product_id != instance.product_id:
+        Product.update_rating_stats(old_product_id, removed=old_rating)
+        Product.update_rating_stats(instance.product_id, added=instance.rating)
+    elif old_rating != instance.rating:
+        Product.update_rating_stats(instance.product_id, added=instance.rating, removed=old_rating)
+
+    instance._stats_rating = instance.rating
+    instance._stats_product_id = instance.product_id
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_stats_on_delete(sender, instance, **kwargs):
+    if instance._stats_product_id is not None:
+        Product.update_rating_stats(instance._stats_product_id, removed=instance._stats_rating)
+
+
+#--------------------Price history----------------------#
+
+@receiver(post_init, sender=Product)
+def remember_product_price(sender, instance, **kwargs):
+    # The raw attribute, so a deferred price is not loaded; unset means unknown
+    if instance.pk is None:
+        instance._history_price = None
+    elif 'price' in instance.__dict__:
+        instance._history_price = instance.__dict__['price']
+
+
+@receiver(post_save, sender=Product)
+def record_price_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'price' not in update_fields):
+        return
+    if 'price' not in instance.__dict__:
+        return
+
+    # Compared with the price loaded with the instance; no re-read of the row
+    to_decimal = sender._meta.get_field('price').to_python
+    old_price, new_price = getattr(instance, '_history_price', None), to_decimal(instance.price)
+    if created or old_price is None or to_decimal(old_price) != new_price:
+        changed_by = getattr(instance, '_price_changed_by', None) or (instance.vendor_id if created else None)
+        PriceHistory.record_current_prices([instance.pk], changed_by=changed_by)
+    instance._history_price = new_price
+
+
+@receiver(post_save, sender=PriceHistory)
+@receiver(post_delete, sender=PriceHistory)
+def invalidate_cached_price_series(sender, instance, raw=False, **kwargs):
+    # Direct edits, e.g. from the admin; record_current_prices invalidates on its own
+    if not raw:
+        invalidate_price_series([instance.product_id])
+
+
+#--------------------Image derivatives----------------------#
+
+@receiver(post_init, sender=ProductImage)
+def remember_image_name(sender, instance, **kwargs):
+    instance._derivatives_name = instance.image.name if instance.pk else None
+
+
+@receiver(post_save, sender=ProductImage)
+def queue_image_derivatives(sender, instance, raw=False, **kwargs):
+    # Only new or replaced files; resizing starts after commit, outside the request
+    if raw or not instance.image or instance.image.name == instance._derivatives_name:
+        return
+    if instance._derivatives_name is not None and instance.renditions:
+        # The old renditions belong to the replaced file
+        instance.width = instance.height = None
+        instance.renditions = {}
+        sender.objects.filter(pk=instance.pk).update(width=None, height=None, renditions={})
+    instance._derivatives_name = instance.image.name
+
+    # Deduplicated upload: another row already has renditions for this file
+    existing = (
+        sender.objects.filter(image=instance.image.name).exclude(pk=instance.pk)
+        .exclude(renditions={}).values('width', 'height', 'renditions').first()
+    )
+    if existing:
+        sender.objects.filter(pk=instance.pk).update(**existing)
+        return
+    transaction.on_commit(partial(schedule_derivatives, instance.pk, instance.image.name))
+
+
+#--------------------Media blob references----------------------#
+
+def track_media_references(model, field_name):
+    """Keep MediaBlob.refcount in step with a file field in content-addressed storage"""
+    attr = f'_blob_{field_name}'
+
+    def stored_name(instance):
+        # The raw attribute, so deferred fields are not loaded (None if deferred)
+        value = instance.__dict__.get(field_name)
+        return getattr(value, 'name', value) or None
+
+    def remember(sender, instance, **kwargs):
+        # Left unset when the field was deferred: the counted name is unknown
+        if instance.pk is None:
+            instance.__dict__[attr] = None
+        elif field_name in instance.__dict__:
+            instance.__dict__[attr] = stored_name(instance)
+
+    def on_save(sender, instance, created, raw=False, **kwargs):
+        if attr not in instance.__dict__ or field_name not in instance.__dict__:
+            return
+        old, new = instance.__dict__.get(attr), stored_name(instance)
+        if old != new:
+            MediaBlob.adjust_references(old, -1)
+            MediaBlob.adjust_references(new, 1)
+            instance.__dict__[attr] = new
+
+    def on_delete(sender, instance, **kwargs):
+        MediaBlob.adjust_references(stored_name(instance) or instance.__dict__.get(attr), -1)
+
+    post_init.connect(remember, sender=model, weak=False)
+    post_save.connect(on_save, sender=model, weak=False)
+    post_delete.connect(on_delete, sender=model, weak=False)
+
+
+for _model, _field in content_addressed_fields():
+    track_media_references(_model, _field.name)
+
+
+#--------------------Discount index----------------------#
+
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+def refresh_discount_index(sender, instance, **kwargs):
+    transaction.on_commit(partial(discount_index.refresh, [instance.pk]))
+
+
+@receiver(m2m_changed, sender=Discount.products.through)
+@receiver(m2m_changed, sender=Discount.categories.through)
+def refresh_discount_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        discount_ids = [instance.pk]
+    else:
+        # product.discounts.clear() does not say which discounts lost the link
+        discount_ids = list(pk_set) if pk_set else None
+    transaction.on_commit(partial(discount_index.refresh, discount_ids))
+
+
+@receiver(discount_status_changed)
+def refresh_swept_discounts(sender, discount_ids, **kwargs):
+    # Sent after the sweep committed; its UPDATEs skipped post_save
+    discount_index.refresh(discount_ids)
+    invalidate_catalog()
+
+
+#--------------------Catalog response cache----------------------#
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Discount.products.through)
+@receiver(m2m_changed, sender=Discount.categories.through)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
@@ -0,0 +1,90 @@
+"""
+Content-addressed media storage.
+
+Files are named by the SHA-256 of their content under the field's upload_to
+directory, sharded on the first two hash bytes:
+
+    products/3f/a2/3fa2...e91c.jpg
+
+Saving content that is already stored writes nothing and returns the
+existing name, so identical uploads share one file. MediaBlob keeps a
+reference count per stored name (see product.signals) and the gc_media
+command deletes blobs nobody references any more.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db.models import FileField
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[\w-]+)?$')
+
+
+def is_content_addressed(name):
+    return bool(name and CONTENT_NAME_RE.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct file once, named by its hash"""
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save; an existing file is a hit, not a clash
+        return str(name).replace('\\', '/')
+
+    def content_name(self, name, digest):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    def _save(self, name, content):
+        directory = self.path(posixpath.dirname(name))
+        os.makedirs(directory, exist_ok=True)
+
+        # Hash while streaming to a temporary file next to the final location,
+        # so the upload is read once and the file appears atomically
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp.write(chunk)
+
+            name = self.content_name(name, digest.hexdigest())
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Already stored; refresh mtime so gc_media treats it as recently used
+                os.utime(full_path)
+                os.unlink(temp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.chmod(temp_path, self.file_permissions_mode or 0o644)
+                # Concurrent identical uploads replace each other with the same bytes
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        return name
+
+
+media_storage = ContentAddressedStorage()
+
+
+def content_addressed_fields():
+    """(model, field) for every file field stored in ContentAddressedStorage"""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
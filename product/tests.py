@@ -1,3 +1,1133 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from order.models import Order
+from users.models import UserProfile
+
+from .cache import (
+    REBUILD_LOCK_TIMEOUT, REBUILD_WAIT, VERSION_KEY, bump_catalog_version, catalog_last_modified,
+    get_catalog_cache, get_catalog_version,
+)
+from .discounts import discount_index, discount_status_changed, sweep_discount_statuses
+from .filters import filter_by_category_tree
+from .images import save_derivatives
+from .importer import ProductImporter
+from .imaging import generate_derivatives
+from .models import (
+    Category, Discount, DiscountUsage, DiscountUsageDaily, MediaBlob, PriceHistory, Product, ProductImage, Review,
+)
+from .redemption import DiscountUnavailable, redeem_discount
+from .renderers import FastJSONRenderer
+from .storage import is_content_addressed
+from .views import discount_boundary_timeout
+
+
+class CatalogQueryCountTests(TestCase):
+    """Listing endpoints cost a fixed number of queries however many products a page holds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        cls.customer = UserProfile.objects.create_user('customer', 'customer@example.com', 'pw')
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendor)
+
+    def make_products(self, count):
+        now = timezone.now()
+        discount = Discount.objects.create(
+            name='Flash', discount_type='percentage', percentage=Decimal('10'),
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=2), created_by=self.vendor,
+        )
+        for i in range(count):
+            product = Product.objects.create(
+                title=f'Phone {i}', description='smart phone', price=Decimal('10.00') + i,
+                stock_quantity=1, vendor=self.vendor,
+            )
+            product.categories.set([self.category])
+            ProductImage.objects.create(product=product, image='products/placeholder.jpg', is_primary=True)
+            Review.objects.create(product=product, user=self.customer, rating=4, title='t', comment='c')
+            discount.products.add(product)
+        # Load the discount index outside the measured requests
+        discount_index.rebuild()
+
+    def assert_queries(self, url, expected, params=None):
+        for count in (2, 6):
+            with self.subTest(products=count):
+                Product.objects.all().delete()
+                Discount.objects.all().delete()
+                get_catalog_cache().clear()
+                self.make_products(count)
+                with self.assertNumQueries(expected):
+                    response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                results = response.data['results'] if 'results' in response.data else response.data['flash_sales']
+                self.assertEqual(len(results), count)
+        return response
+
+    def test_product_list(self):
+        self.assert_queries('/products/', 3)
+
+    def test_all_products(self):
+        self.assert_queries('/products/all-products/', 3)
+        # Served from the catalog cache
+        with self.assertNumQueries(0):
+            self.client.get('/products/all-products/')
+
+    def test_vendor_products(self):
+        self.assert_queries('/products/vendor/my-products/', 3)
+
+    def test_search(self):
+        self.assert_queries('/products/search/', 3, {'q': 'phone'})
+
+    def test_flash_sales(self):
+        self.assert_queries('/products/flash-sales/', 3)
+        with self.assertNumQueries(0):
+            self.client.get('/products/flash-sales/')
+
+
+class CatalogRendererTests(TestCase):
+    def test_catalog_views_render_with_the_fast_renderer_only(self):
+        response = APIClient().get('/products/categories/')
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        response = APIClient().get('/products/discounts/active/')
+        self.assertNotIsInstance(response.accepted_renderer, FastJSONRenderer)
+
+
+class CatalogVersionTests(TestCase):
+    def test_versions_within_one_second_get_distinct_last_modified(self):
+        get_catalog_cache().clear()
+        seen = [catalog_last_modified(None)]
+        with mock.patch('time.time', return_value=time.time()):
+            for _ in range(3):
+                bump_catalog_version()
+                seen.append(catalog_last_modified(None))
+        self.assertEqual(seen, sorted(set(seen)))
+        self.assertEqual(len(seen), 4)
+
+    def test_concurrent_bumps_after_idle_do_not_run_ahead_of_the_clock(self):
+        cache = get_catalog_cache()
+        now = int(time.time())
+        cache.set(VERSION_KEY, now - 3600, timeout=None)
+        barrier = threading.Barrier(2)
+
+        def bump():
+            barrier.wait()
+            bump_catalog_version()
+
+        with mock.patch('time.time', return_value=now + 0.5):
+            workers = [threading.Thread(target=bump) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(cache.get(VERSION_KEY), now + 1)
+
+
+class CatalogRebuildLockTests(TestCase):
+    def test_waiters_give_up_long_before_the_lock_expires(self):
+        cache = get_catalog_cache()
+        cache.clear()
+        add = cache.add
+
+        def add_unless_lock(key, *args, **kwargs):
+            # Another request holds the rebuild lock and never finishes
+            return False if key.endswith(':lock') else add(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'add', side_effect=add_unless_lock):
+            started = time.monotonic()
+            response = APIClient().get('/products/categories/')
+            elapsed = time.monotonic() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(elapsed, REBUILD_WAIT)
+        self.assertLess(elapsed, REBUILD_LOCK_TIMEOUT / 10)
+
+
+class DiscountBoundaryTests(TestCase):
+    """Effective prices change when a discount starts or ends, without any catalog write"""
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=vendor)
+        self.now = timezone.now()
+        discount = Discount.objects.create(
+            name='Short', discount_type='percentage', percentage=Decimal('10'),
+            start_date=self.now - timedelta(hours=1), end_date=self.now + timedelta(seconds=90), created_by=vendor,
+        )
+        discount.products.add(self.product)
+        self.client = APIClient()
+
+    def test_cached_listing_expires_at_the_next_boundary(self):
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            self.assertEqual(discount_boundary_timeout(None), 90)
+        with mock.patch('django.utils.timezone.now', return_value=self.now + timedelta(seconds=91)):
+            self.assertEqual(discount_boundary_timeout(None), 10 * 60)
+
+    def test_validators_change_at_the_boundary(self):
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            response = self.client.get('/products/all-products/')
+            self.assertEqual(response.data['results'][0]['effective_price'], '9.00')
+            etag, last_modified = response['ETag'], response['Last-Modified']
+            response = self.client.get('/products/all-products/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        with mock.patch('django.utils.timezone.now', return_value=self.now + timedelta(seconds=91)):
+            response = self.client.get('/products/all-products/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get('/products/all-products/', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+
+
+class ProductExportTests(TestCase):
+    def test_admins_export_everything_and_customers_nothing(self):
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        admin = UserProfile.objects.create_user('admin', 'admin@example.com', 'pw', user_type='admin')
+        customer = UserProfile.objects.create_user('customer', 'customer@example.com', 'pw', is_staff=True)
+        Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=vendor)
+        client = APIClient()
+
+        client.force_authenticate(admin)
+        response = client.get('/products/vendor/export/')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+        client.force_authenticate(customer)
+        self.assertEqual(client.get('/products/vendor/export/').status_code, 403)
+
+
+class BulkRepriceTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=self.vendor)
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendor)
+
+    def reprice(self, **data):
+        return self.client.post('/products/vendor/reprice/', data, format='json')
+
+    def test_invalid_prices_are_rejected_per_row(self):
+        for price in ('NaN', 'Infinity', '-1.00'):
+            with self.subTest(price=price):
+                response = self.reprice(prices=[{'id': self.product.id, 'price': price}])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(0, response.data['prices'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('10.00'))
+
+    def prices(self):
+        return dict(Product.objects.values_list('id', 'price'))
+
+    def test_price_list_writes_changes_and_their_history(self):
+        same = Product.objects.create(title='Case', description='d', price=Decimal('20.00'), vendor=self.vendor)
+        response = self.reprice(prices=[
+            {'id': self.product.id, 'price': '12.5'}, {'id': same.id, 'price': 20},
+        ])
+
+        self.assertEqual(response.data, {'updated': 1})
+        self.assertEqual(self.prices(), {self.product.id: Decimal('12.50'), same.id: Decimal('20.00')})
+        history = PriceHistory.objects.filter(product=self.product).order_by('start_date', 'id')
+        self.assertEqual(
+            [(row.original_price, row.end_date is None, row.created_by_id) for row in history],
+            [(Decimal('10.00'), False, self.vendor.id), (Decimal('12.50'), True, self.vendor.id)],
+        )
+        self.assertEqual(PriceHistory.objects.filter(product=same).count(), 1)
+
+    def test_other_vendors_products_are_not_found(self):
+        other = UserProfile.objects.create_user('other', 'other@example.com', user_type='vendor')
+        theirs = Product.objects.create(title='Theirs', description='d', price=Decimal('5.00'), vendor=other)
+        response = self.reprice(prices=[{'id': self.product.id, 'price': '1'}, {'id': theirs.id, 'price': '1'}])
+
+        self.assertEqual((response.status_code, response.data['ids']), (400, [theirs.id]))
+        self.assertEqual(self.prices(), {self.product.id: Decimal('10.00'), theirs.id: Decimal('5.00')})
+
+    def test_percentage_rule_covers_the_category_subtree(self):
+        audio = Category.objects.create(name='Audio', slug='audio')
+        headphones = Category.objects.create(name='Headphones', slug='headphones', parent=audio)
+        self.product.categories.add(headphones)
+        outside = Product.objects.create(title='Desk', description='d', price=Decimal('99.99'), vendor=self.vendor)
+
+        response = self.reprice(category='audio', percent='-12.5')
+        self.assertEqual(response.data, {'updated': 1})
+        self.assertEqual(self.prices(), {self.product.id: Decimal('8.75'), outside.id: Decimal('99.99')})
+        self.assertEqual(self.reprice(category='audio').status_code, 400)
+        self.assertEqual(self.reprice(category='garden', percent='5').status_code, 400)
+
+
+class FlashSaleValidatorTests(TestCase):
+    def test_validators_change_when_a_discount_enters_the_window(self):
+        get_catalog_cache().clear()
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        product = Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=vendor)
+        now = timezone.now()
+        discount = Discount.objects.create(
+            name='Soon', discount_type='percentage', percentage=Decimal('10'),
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=24, seconds=60), created_by=vendor,
+        )
+        discount.products.add(product)
+        client = APIClient()
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = client.get('/products/flash-sales/')
+            self.assertEqual(response.data['flash_sales'], [])
+            etag = response['ETag']
+            self.assertEqual(client.get('/products/flash-sales/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=61)):
+            self.assertEqual(client.get('/products/flash-sales/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ProductCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        # Repeated prices, so pages have to break ties on id
+        cls.products = [
+            Product.objects.create(title=f'Phone {i}', description='d', price=Decimal(10 + i % 3), vendor=cls.vendor)
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendor)
+
+    def walk(self, url, params, direction='next'):
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([product['id'] for product in response.data['results']])
+            url, params = response.data[direction], None
+        return pages, response
+
+    def test_pages_cover_every_product_once_in_order(self):
+        for ordering, key in (('-created_at', lambda p: (p.created_at, p.id)), ('price', lambda p: (p.price, p.id))):
+            with self.subTest(ordering=ordering):
+                pages, last = self.walk('/products/', {'ordering': ordering, 'page_size': 3})
+                expected = [p.id for p in sorted(self.products, key=key, reverse=ordering.startswith('-'))]
+                self.assertEqual([len(page) for page in pages], [3, 3, 1])
+                self.assertEqual(sum(pages, []), expected)
+
+                # And back again from the last page
+                back, _ = self.walk(last.data['previous'], None, direction='previous')
+                self.assertEqual(sum(reversed(back), []), expected[:6])
+
+
+class ProductReviewListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        cls.product = Product.objects.create(title='Phone', description='d', price=Decimal('10'), vendor=vendor)
+        cls.reviews = [
+            Review.objects.create(
+                product=cls.product, rating=i % 5 + 1, title='t', comment='c',
+                user=UserProfile.objects.create_user(f'customer{i}', f'customer{i}@example.com'),
+            )
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        get_catalog_cache().clear()
+
+    def walk(self, params):
+        pages, url = [], f'/products/{self.product.id}/reviews/'
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([review['id'] for review in response.data['results']])
+            url, params = response.data['next'], None
+        return pages
+
+    def test_pages_cover_every_review_once_in_order(self):
+        for ordering, key in (('-created_at', lambda r: (r.created_at, r.id)), ('rating', lambda r: (r.rating, r.id))):
+            with self.subTest(ordering=ordering):
+                pages = self.walk({'ordering': ordering})
+                expected = [r.id for r in sorted(self.reviews, key=key, reverse=ordering.startswith('-'))]
+                self.assertEqual([len(page) for page in pages], [10, 2])
+                self.assertEqual(sum(pages, []), expected)
+
+    def test_detail_embeds_only_the_newest_reviews(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/products/{self.product.id}/')
+        newest = sorted(self.reviews, key=lambda r: (r.created_at, r.id), reverse=True)[:5]
+        self.assertEqual([review['id'] for review in response.data['reviews']], [r.id for r in newest])
+        self.assertEqual(response.data['review_count'], 12)
+        self.assertEqual(response.data['reviews_url'], f'/products/{self.product.id}/reviews/')
+
+    def test_unknown_product_is_a_404(self):
+        self.assertEqual(self.client.get('/products/0/reviews/').status_code, 404)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.lamp = Product.objects.create(title='Desk lamp', description='Warm light', price=Decimal('20'), vendor=cls.vendor)
+        cls.shade = Product.objects.create(
+            title='Shade', description='Fits any lamp base', price=Decimal('5'), vendor=cls.vendor
+        )
+        cls.bulb = Product.objects.create(title='Bulb', description='E27', price=Decimal('2'), vendor=cls.vendor)
+        cls.bulb.categories.add(lighting)
+        Product.objects.create(title='Old lamp', description='d', price=Decimal('1'), vendor=cls.vendor, is_active=False)
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get('/products/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('lamp'), [self.lamp.id, self.shade.id])
+
+    def test_words_match_as_prefixes_and_categories_are_indexed(self):
+        self.assertEqual(self.search('des lam'), [self.lamp.id])
+        self.assertEqual(self.search('lighting'), [self.bulb.id])
+
+    def test_fts_syntax_in_queries_is_taken_literally(self):
+        for query in ('"lamp', 'lamp*', '-lamp', '(lamp)', '^lamp'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [self.lamp.id, self.shade.id])
+        # Operators and column filters are words to find like any other
+        for query in ('lamp OR bulb', 'NEAR(lamp bulb)', 'title:lamp', '()*"'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [])
+
+    def test_index_follows_product_changes(self):
+        self.bulb.title = 'Lamp bulb'
+        self.bulb.save()
+        self.lamp.is_active = False
+        self.lamp.save()
+        self.assertEqual(sorted(self.search('lamp')), sorted([self.bulb.id, self.shade.id]))
+
+
+class InvalidCursorTests(TestCase):
+    def test_malformed_cursors_are_not_found(self):
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        client = APIClient()
+        client.force_authenticate(vendor)
+        payloads = [
+            {'o': 1, 'v': '2026-01-01T00:00:00', 'id': 1, 'r': False},
+            {'o': '-created_at', 'v': 5, 'id': 1, 'r': False},
+            {'o': '-created_at', 'v': '2026-01-01T00:00:00', 'id': [1], 'r': False},
+            ['-created_at'],
+            'cursor',
+        ]
+        cursors = [base64.urlsafe_b64encode(json.dumps(payload).encode()).decode() for payload in payloads]
+        for cursor in cursors + ['not base64!']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(client.get('/products/', {'cursor': cursor}).status_code, 404)
+
+
+class FacetCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        cls.phones = Category.objects.create(name='Phones', slug='phones')
+        cls.cases = Category.objects.create(name='Cases', slug='cases')
+        for price, stock, categories in (
+            ('10', 0, [cls.cases]), ('60', 3, [cls.phones, cls.cases]), ('300', 1, [cls.phones]), ('3000', 2, []),
+        ):
+            product = Product.objects.create(
+                title='Item', description='d', price=Decimal(price), stock_quantity=stock, vendor=cls.vendor
+            )
+            product.categories.set(categories)
+        Product.objects.create(title='Gone', description='d', price=Decimal('10'), vendor=cls.vendor, is_active=False)
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendor)
+
+    def facets(self, **params):
+        return self.client.get('/products/', {'facets': 'true', **params}).data['facets']
+
+    def test_catalog_counts(self):
+        facets = self.facets()
+        self.assertEqual(facets['categories'], {'cases': 2, 'phones': 2})
+        self.assertEqual([band['count'] for band in facets['price']], [1, 1, 0, 1, 0, 0, 1])
+        self.assertEqual(facets['in_stock'], {'true': 3, 'false': 1})
+
+    def test_counts_follow_the_filters(self):
+        facets = self.facets(category='phones')
+        self.assertEqual(facets['categories'], {'cases': 1, 'phones': 2})
+        self.assertEqual(facets['in_stock'], {'true': 2, 'false': 0})
+
+    def test_cached_catalog_counts_follow_writes(self):
+        self.facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='New', description='d', price=Decimal('20'), vendor=self.vendor)
+        self.assertEqual(self.facets()['in_stock'], {'true': 3, 'false': 2})
+
+
+class CategoryPathTests(TestCase):
+    def setUp(self):
+        self.home = Category.objects.create(name='Home', slug='home')
+        self.kitchen = Category.objects.create(name='Kitchen', slug='kitchen', parent=self.home)
+        self.knives = Category.objects.create(name='Knives', slug='knives', parent=self.kitchen)
+        self.outdoor = Category.objects.create(name='Outdoor', slug='outdoor')
+
+    def paths(self):
+        return dict(Category.objects.values_list('slug', 'path'))
+
+    def test_reparenting_rewrites_the_subtree(self):
+        self.kitchen.parent = self.outdoor
+        self.kitchen.save()
+
+        o, k, n = self.outdoor.pk, self.kitchen.pk, self.knives.pk
+        self.assertEqual(self.paths(), {
+            'home': f'{self.home.pk}/', 'outdoor': f'{o}/', 'kitchen': f'{o}/{k}/', 'knives': f'{o}/{k}/{n}/',
+        })
+        self.home.refresh_from_db()
+        self.assertEqual(list(self.home.get_descendants(include_self=False)), [])
+
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        knife = Product.objects.create(title='Knife', description='d', price=Decimal('5'), vendor=vendor)
+        knife.categories.add(self.knives)
+        self.assertEqual(list(filter_by_category_tree(Product.objects.all(), 'outdoor')), [knife])
+        self.assertEqual(list(filter_by_category_tree(Product.objects.all(), 'home')), [])
+
+    def test_moving_to_root_and_sibling_prefixes(self):
+        # Enough siblings for multi-digit ids, whose paths share prefixes with single-digit ones
+        for i in range(10):
+            Category.objects.create(name=f'Filler {i}', slug=f'filler-{i}', parent=self.outdoor)
+        self.kitchen.parent = None
+        self.kitchen.save()
+
+        self.knives.refresh_from_db()
+        self.assertEqual(self.knives.path, f'{self.kitchen.pk}/{self.knives.pk}/')
+        self.assertEqual(set(self.kitchen.get_descendants()), {self.kitchen, self.knives})
+        self.assertEqual(self.outdoor.get_descendants().count(), 11)
+
+    def test_cannot_move_under_own_subtree(self):
+        self.home.parent = self.knives
+        with self.assertRaises(ValidationError):
+            self.home.clean()
+
+
+def image_upload(size, color='red', name='photo.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class TemporaryMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_settings = self.settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class ImageDerivativeTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('10'), vendor=vendor)
+
+    def upload(self, size, color='red'):
+        with mock.patch('product.signals.schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ProductImage.objects.create(product=self.product, image=image_upload(size, color))
+        return image, schedule
+
+    def test_renditions_are_resized_without_upscaling(self):
+        image, _ = self.upload((1000, 500))
+        result = generate_derivatives(self.media_root, image.image.name)
+
+        self.assertEqual((result['width'], result['height']), (1000, 500))
+        expected = {'thumbnail': (200, 100), 'medium': (800, 400)}
+        for label, size in expected.items():
+            rendition = result['renditions'][label]
+            self.assertEqual((rendition['width'], rendition['height']), size)
+            for key, image_format in (('jpeg', 'JPEG'), ('webp', 'WEBP')):
+                with Image.open(os.path.join(self.media_root, rendition[key])) as derivative:
+                    self.assertEqual((derivative.format, derivative.size), (image_format, size))
+
+        small, _ = self.upload((120, 90), color='blue')
+        renditions = generate_derivatives(self.media_root, small.image.name)['renditions']
+        self.assertEqual((renditions['medium']['width'], renditions['medium']['height']), (120, 90))
+
+    def test_upload_queues_derivatives_after_commit_and_records_them(self):
+        image, schedule = self.upload((400, 400))
+        schedule.assert_called_once_with(image.pk, image.image.name)
+
+        result = generate_derivatives(self.media_root, image.image.name)
+        self.assertEqual(save_derivatives(image.pk, image.image.name, result), 1)
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (400, 400))
+        self.assertEqual(image.renditions['thumbnail']['width'], 200)
+
+        # Identical content reuses the stored renditions instead of resizing again
+        copy, schedule = self.upload((400, 400))
+        schedule.assert_not_called()
+        copy.refresh_from_db()
+        self.assertEqual(copy.renditions, image.renditions)
+
+    def test_results_for_a_replaced_file_are_dropped(self):
+        image, _ = self.upload((400, 400))
+        stale = image.image.name
+        result = generate_derivatives(self.media_root, stale)
+
+        image.image = image_upload((300, 300), color='green')
+        image.save()
+        self.assertEqual(save_derivatives(image.pk, stale, result), 0)
+        image.refresh_from_db()
+        self.assertEqual(image.renditions, {})
+
+
+@mock.patch('product.signals.schedule_derivatives')
+class MediaDeduplicationTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('10'), vendor=vendor)
+
+    def add_image(self, upload):
+        return ProductImage.objects.create(product=self.product, image=upload)
+
+    def refcounts(self):
+        return dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.media_root).replace(os.sep, '/')
+            for dirpath, _, filenames in os.walk(self.media_root) for filename in filenames
+        )
+
+    def test_identical_uploads_share_one_counted_file(self, schedule):
+        first = self.add_image(image_upload((50, 50), name='a.png'))
+        second = self.add_image(image_upload((50, 50), name='b.PNG'))
+        other = self.add_image(image_upload((50, 50), color='blue'))
+
+        shared = first.image.name
+        self.assertEqual(second.image.name, shared)
+        self.assertTrue(is_content_addressed(shared))
+        self.assertEqual(self.stored_files(), sorted([shared, other.image.name]))
+        self.assertEqual(self.refcounts(), {shared: 2, other.image.name: 1})
+
+        second.delete()
+        first.image = other.image.name
+        first.save()
+        self.assertEqual(self.refcounts(), {shared: 0, other.image.name: 2})
+        # Deleting a row never deletes the shared file; that is left to gc_media
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_gc_deletes_only_unreferenced_files_and_their_derivatives(self, schedule):
+        kept = self.add_image(image_upload((50, 50)))
+        dropped = self.add_image(image_upload((50, 50), color='blue'))
+        garbage = dropped.image.name
+        generate_derivatives(self.media_root, garbage)
+        dropped.delete()
+
+        call_command('gc_media', grace_hours=0, stdout=io.StringIO())
+        self.assertEqual(self.stored_files(), [kept.image.name])
+        self.assertEqual(self.refcounts(), {kept.image.name: 1})
+
+    def test_dedupe_moves_legacy_files_into_shared_storage(self, schedule):
+        upload = image_upload((50, 50))
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        for legacy in ('one.png', 'two.png'):
+            with open(os.path.join(self.media_root, 'products', legacy), 'wb') as legacy_file:
+                legacy_file.write(upload.read())
+            upload.seek(0)
+            image = self.add_image(image_upload((50, 50)))
+            ProductImage.objects.filter(pk=image.pk).update(image=f'products/{legacy}')
+
+        call_command('dedupe_media', stdout=io.StringIO())
+        names = set(ProductImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(is_content_addressed(name))
+        self.assertEqual(self.stored_files(), [name])
+        self.assertEqual(self.refcounts(), {name: 2})
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        cls.lighting = Category.objects.create(name='Lighting', slug='lighting')
+        cls.desks = Category.objects.create(name='Desks', slug='desks')
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendor)
+
+    def upload(self, name, content, **data):
+        return self.client.post('/products/import/', {'file': SimpleUploadedFile(name, content.encode()), **data})
+
+    def test_csv_rows_are_created_and_bad_rows_reported(self):
+        response = self.upload('catalog.csv', (
+            'title,description,price,stock_quantity,categories\n'
+            'Desk lamp,Warm light,19.99,4,lighting|desks\n'
+            'Broken,d,cheap,1,\n'
+            'Chair,d,40,,chairs\n'
+            'Bulb,E27,2.50,,\n'
+        ))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 2))
+        self.assertEqual([(error['row'], list(error['errors'])) for error in response.data['errors']], [
+            (3, ['price']), (4, ['categories']),
+        ])
+
+        lamp = Product.objects.get(title='Desk lamp')
+        self.assertEqual((lamp.vendor, lamp.price, lamp.stock_quantity), (self.vendor, Decimal('19.99'), 4))
+        self.assertEqual(set(lamp.categories.all()), {self.lighting, self.desks})
+        self.assertEqual(Product.objects.get(title='Bulb').stock_quantity, 0)
+
+        # Bulk inserts skip signals, so the importer indexes and records prices itself
+        self.assertEqual(PriceHistory.objects.filter(product=lamp, end_date__isnull=True).count(), 1)
+        search = self.client.get('/products/search/', {'q': 'lamp'})
+        self.assertEqual([product['id'] for product in search.data['results']], [lamp.id])
+
+    def test_json_lines_in_small_batches(self):
+        lines = [
+            json.dumps({'title': f'Item {i}', 'description': 'd', 'price': '1.00', 'categories': ['lighting']})
+            for i in range(5)
+        ]
+        lines.insert(2, '{not json')
+        report = ProductImporter(self.vendor, batch_size=2).run(io.BytesIO('\n'.join(lines).encode()), 'jsonl')
+
+        self.assertEqual((report['created'], report['failed']), (5, 1))
+        self.assertEqual(report['errors'][0]['row'], 3)
+        self.assertEqual(self.lighting.product_set.count(), 5)
+
+    def test_unsupported_uploads_are_rejected(self):
+        self.assertEqual(self.upload('catalog.xlsx', 'x').status_code, 400)
+        self.assertEqual(self.client.post('/products/import/', {}).status_code, 400)
+        customer = UserProfile.objects.create_user('customer', 'customer@example.com')
+        self.client.force_authenticate(customer)
+        self.assertEqual(self.upload('catalog.csv', 'title\n').status_code, 403)
+        self.assertFalse(Product.objects.exists())
+
+
+class PriceHistoryRecordingTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=self.vendor)
+
+    def history(self):
+        return list(PriceHistory.objects.filter(product=self.product).order_by('start_date', 'id'))
+
+    def test_price_changes_close_the_open_row(self):
+        [opened] = self.history()
+        self.assertEqual((opened.original_price, opened.end_date, opened.created_by), (Decimal('10.00'), None, self.vendor))
+
+        self.product.price = '10'
+        self.product.save()
+        self.product.title = 'Phone 2'
+        self.product.save()
+        self.assertEqual(len(self.history()), 1)
+
+        self.product.price = Decimal('12.00')
+        self.product.save()
+        closed, current = self.history()
+        self.assertEqual(closed.end_date, current.start_date)
+        self.assertEqual((current.original_price, current.end_date, current.created_by), (Decimal('12.00'), None, None))
+
+    def test_saves_that_cannot_change_the_price_are_skipped(self):
+        self.product.price = Decimal('15.00')
+        self.product.save(update_fields=['title'])
+        deferred = Product.objects.only('id', 'title').get(pk=self.product.pk)
+        deferred.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            deferred.save()
+        # Neither the deferred price nor the history is read
+        self.assertFalse([q['sql'] for q in queries if 'pricehistory' in q['sql'] or q['sql'].startswith('SELECT')])
+        self.assertEqual(len(self.history()), 1)
+
+    def test_update_view_records_who_changed_the_price(self):
+        client = APIClient()
+        client.force_authenticate(self.vendor)
+        self.product.price = Decimal('11.00')
+        self.product.save()
+
+        response = client.patch(f'/products/{self.product.id}/update/', {'price': '9.50'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row.original_price, row.created_by) for row in self.history()],
+            [(Decimal('10.00'), self.vendor), (Decimal('11.00'), None), (Decimal('9.50'), self.vendor)],
+        )
+
+    def test_history_view_filters_by_overlap_with_the_range(self):
+        self.product.price = Decimal('12.00')
+        self.product.save()
+        first, second = self.history()
+        new_year, change = (timezone.make_aware(datetime(2026, 1, day, hour)) for day, hour in ((1, 0), (10, 12)))
+        PriceHistory.objects.filter(pk=first.pk).update(start_date=new_year, end_date=change)
+        PriceHistory.objects.filter(pk=second.pk).update(start_date=change)
+
+        client = APIClient()
+        client.force_authenticate(self.vendor)
+        url = f'/products/products/{self.product.id}/price-history/'
+        for params, expected in (
+            ({'end': '2026-01-05'}, [first.pk]),
+            ({'start': '2026-01-11'}, [second.pk]),
+            # A date covers the whole day
+            ({'end': '2026-01-10'}, [second.pk, first.pk]),
+            ({'start': '2026-01-10T13:00', 'end': '2026-01-10T14:00'}, [second.pk]),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual([row['id'] for row in client.get(url, params).data], expected)
+        self.assertEqual(client.get(url, {'start': 'yesterday'}).status_code, 400)
+
+
+class PriceSeriesTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('9.00'), vendor=self.vendor)
+        self.product.price_history.all().delete()
+        changes = [
+            (datetime(2026, 1, 1, 10), Decimal('10.00')),
+            (datetime(2026, 1, 2, 12), Decimal('8.00')),
+            (datetime(2026, 1, 2, 18), Decimal('9.00')),
+        ]
+        starts = [timezone.make_aware(moment) for moment, _ in changes]
+        PriceHistory.objects.bulk_create([
+            PriceHistory(product=self.product, original_price=price, start_date=start, end_date=end)
+            for (_, price), start, end in zip(changes, starts, starts[1:] + [None])
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.vendor)
+
+    def series(self, **params):
+        response = self.client.get(f'/products/products/{self.product.id}/price-history/series/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(point['min'], point['max'], point['last']) for point in response.data['points']]
+
+    def test_daily_buckets_carry_prices_between_changes(self):
+        expected = [
+            (Decimal('10.00'), Decimal('10.00'), Decimal('10.00')),
+            (Decimal('8.00'), Decimal('10.00'), Decimal('9.00')),
+            (Decimal('9.00'), Decimal('9.00'), Decimal('9.00')),
+            (Decimal('9.00'), Decimal('9.00'), Decimal('9.00')),
+        ]
+        # No points before the first recorded price
+        self.assertEqual(self.series(interval='day', start='2025-12-30', end='2026-01-04'), expected)
+
+        # Hot products are answered from cached daily buckets, with the same result
+        with mock.patch('product.timeseries.HOT_VIEWS', 1):
+            self.assertEqual(self.series(interval='day', start='2026-01-01', end='2026-01-04'), expected)
+            self.assertEqual(
+                self.series(interval='week', start='2025-12-29', end='2026-01-04'),
+                [(Decimal('8.00'), Decimal('10.00'), Decimal('9.00'))],
+            )
+            # A price change drops the cached buckets once it commits
+            self.product.price = Decimal('7.00')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product.save()
+            self.assertEqual(self.series(interval='day', start='2026-01-03', end='2026-01-04'), expected[2:])
+            self.assertEqual(self.series(interval='day')[-1][2], Decimal('7.00'))
+
+    def test_prices_before_the_window_carry_in(self):
+        self.assertEqual(self.series(interval='hour', start='2026-01-02T13:00', end='2026-01-02T15:00'), [
+            (Decimal('8.00'), Decimal('8.00'), Decimal('8.00')),
+            (Decimal('8.00'), Decimal('8.00'), Decimal('8.00')),
+        ])
+
+    def test_invalid_ranges_are_rejected(self):
+        url = f'/products/products/{self.product.id}/price-history/series/'
+        for params in (
+            {'interval': 'month'},
+            {'interval': 'day', 'start': '2026-01-05', 'end': '2026-01-01'},
+            {'interval': 'hour', 'start': '2024-01-01', 'end': '2026-01-01'},
+            {'start': 'soon'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class DiscountStatusSweepTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.now = timezone.now()
+
+    def discount(self, name, starts_in, ends_in, **fields):
+        return Discount.objects.create(
+            name=name, discount_type='percentage', percentage=Decimal('10'), created_by=self.vendor,
+            start_date=self.now + timedelta(hours=starts_in), end_date=self.now + timedelta(hours=ends_in), **fields
+        )
+
+    def statuses(self):
+        return dict(Discount.objects.values_list('name', 'status'))
+
+    def test_due_discounts_move_on_and_listeners_hear_once(self):
+        self.discount('starting', 1, 5)
+        self.discount('ending', -1, 1)
+        self.discount('short', 1, 2)
+        self.discount('disabled', 1, 5, is_active=False)
+        cancelled = self.discount('cancelled', 1, 5)
+        Discount.objects.filter(pk=cancelled.pk).update(status='cancelled')
+
+        heard = []
+        def listener(sender, discount_ids, old_status, new_status, **kwargs):
+            heard.append((old_status, new_status, sorted(discount_ids)))
+        discount_status_changed.connect(listener)
+        self.addCleanup(discount_status_changed.disconnect, listener)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = sweep_discount_statuses(now=self.now + timedelta(hours=3))
+        self.assertEqual(set(changed), {('scheduled', 'active'), ('scheduled', 'expired'), ('active', 'expired')})
+        self.assertEqual(self.statuses(), {
+            'starting': 'active', 'ending': 'expired', 'short': 'expired',
+            'disabled': 'scheduled', 'cancelled': 'cancelled',
+        })
+        self.assertEqual(len(heard), 3)
+
+        # Nothing is due twice
+        self.assertEqual(sweep_discount_statuses(now=self.now + timedelta(hours=3)), {})
+
+    def test_swept_discounts_reach_the_index_and_the_catalog(self):
+        product = Product.objects.create(title='Phone', description='d', price=Decimal('10'), vendor=self.vendor)
+        discount = self.discount('sale', -1, 1)
+        discount.products.add(product)
+        Discount.objects.filter(pk=discount.pk).update(status='scheduled')
+        version = get_catalog_version()
+
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('sweep_discounts', stdout=out)
+        self.assertIn('scheduled -> active: 1 discounts', out.getvalue())
+        self.assertEqual(discount_index.get(discount.pk).status, 'active')
+        self.assertGreater(get_catalog_version(), version)
+
+
+class ProductRatingStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        cls.customer = UserProfile.objects.create_user('customer', 'customer@example.com', 'pw')
+
+    def test_save_keeps_concurrent_rating_updates(self):
+        product = Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=self.vendor)
+        stale = Product.objects.get(pk=product.pk)
+        Review.objects.create(product=product, user=self.customer, rating=5, title='t', comment='c')
+
+        stale.price = Decimal('12.00')
+        stale.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal('12.00'))
+        self.assertEqual((product.review_count, product.rating_sum, product.rating_5_count), (1, 5, 1))
+        self.assertEqual(product.average_rating, 5.0)
+
+
+class VendorDiscountUsageReportTests(TestCase):
+    def test_invalid_dates_are_rejected(self):
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        client = APIClient()
+        client.force_authenticate(vendor)
+        for value in ('nope', '2026-02-30', '2026-13-45'):
+            with self.subTest(value=value):
+                response = client.get('/products/vendor/discounts/usage/', {'start': value})
+                self.assertEqual(response.status_code, 400)
+        response = client.get('/products/vendor/discounts/usage/', {'start': '2026-02-28', 'end': '2026-03-01'})
+        self.assertEqual(response.status_code, 200)
+
+
+class LiveDiscountResponseTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.product = Product.objects.create(title='Phone', description='d', price=Decimal('10.00'), vendor=self.vendor)
+        now = timezone.now()
+        self.discount = Discount.objects.create(
+            name='Limited', discount_type='percentage', percentage=Decimal('10'),
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1),
+            usage_limit=1, apply_to_all_products=True, created_by=self.vendor,
+        )
+        self.client = APIClient()
+
+    def test_index_backed_responses_skip_the_database(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.product.categories.add(category)
+        for i in range(5):
+            discount = Discount.objects.create(
+                name=f'Linked {i}', discount_type='percentage', percentage=Decimal('5'),
+                start_date=self.discount.start_date, end_date=self.discount.end_date, created_by=self.vendor,
+            )
+            discount.products.add(self.product)
+            discount.categories.add(category)
+        discount_index.rebuild()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/discounts/active/')
+        self.assertEqual(len(response.data), 6)
+        linked = response.data[0]
+        self.assertEqual(
+            (linked['products'], linked['categories'], linked['products_count']),
+            ([self.product.id], [category.id], 1)
+        )
+        self.assertEqual(response.data[-1]['products_count'], 'All Products')
+        self.assertIn('usage_count', linked)
+
+        # The product and its categories only
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/products/products/{self.product.id}/discounts/')
+        self.assertEqual(len(response.data), 6)
+
+    def test_redemptions_update_the_indexed_usage_count(self):
+        order_config = apps.get_app_config('order')
+        order_config.create_default_order_statuses()
+        order_config.create_default_payment_statuses()
+        Discount.objects.filter(pk=self.discount.pk).update(usage_limit=5)
+        discount_index.rebuild()
+        order = Order.objects.create(
+            order_number='USAGE-1', user=self.vendor, shipping_address='-', shipping_city='-',
+            shipping_state='-', shipping_zipcode='-', shipping_country='-',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            redeem_discount(self.discount.id, order, [(self.product.id, self.product.price, Decimal('1.00'))])
+        response = self.client.get('/products/discounts/active/')
+        self.assertEqual(response.data[0]['usage_count'], 1)
+
+    def test_calculate_checks_the_current_usage_count(self):
+        discount_index.rebuild()
+        # Used up behind the index's back
+        Discount.objects.filter(pk=self.discount.pk).update(usage_count=1)
+        response = self.client.post(
+            '/products/calculate-discount/', {'product_id': self.product.id, 'discount_id': self.discount.id}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class DiscountAssignmentTests(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.other = UserProfile.objects.create_user('other', 'other@example.com', 'pw', user_type='vendor')
+        self.products = [
+            Product.objects.create(title=f'Phone {i}', description='d', price=Decimal('10.00'), vendor=self.vendor)
+            for i in range(3)
+        ]
+        now = timezone.now()
+        self.discount = Discount.objects.create(
+            name='Sale', discount_type='percentage', percentage=Decimal('10'),
+            start_date=now, end_date=now + timedelta(days=1), created_by=self.vendor,
+        )
+        self.url = f'/products/discounts/{self.discount.id}/assign/'
+        self.client = APIClient()
+
+    def test_owner_assigns_by_filter_and_ids(self):
+        self.client.force_authenticate(self.vendor)
+        response = self.client.post(self.url, {'filter': {'max_price': 50}}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['products'], {'added': 3, 'removed': 0})
+
+        response = self.client.post(
+            self.url, {'products': [self.products[0].id], 'mode': 'replace'}, format='json'
+        )
+        self.assertEqual(response.data['products'], {'added': 0, 'removed': 2})
+        self.assertEqual(list(self.discount.products.all()), [self.products[0]])
+
+    def test_vendors_cannot_touch_other_vendors_discounts(self):
+        self.client.force_authenticate(self.other)
+        response = self.client.post(self.url, {'products': [self.products[0].id]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.discount.products.exists())
+
+
+class DiscountRedemptionStressTests(TransactionTestCase):
+    """Many threads redeem one limited discount; it must never go past its limit"""
+    threads = 16
+    orders_per_thread = 10
+    usage_limit = 60
+    max_lines = 3
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        order_config = apps.get_app_config('order')
+        order_config.create_default_order_statuses()
+        order_config.create_default_payment_statuses()
+        vendor = UserProfile.objects.create_user('vendor', 'vendor@example.com', 'pw', user_type='vendor')
+        self.products = [
+            Product.objects.create(title=f'Product {i}', description='d', price=Decimal('20.00'), vendor=vendor)
+            for i in range(self.max_lines)
+        ]
+        now = timezone.now()
+        self.discount = Discount.objects.create(
+            name='Limited', discount_type='percentage', percentage=Decimal('10'),
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1),
+            usage_limit=self.usage_limit, created_by=vendor,
+        )
+        # Explicit numbers: generated ones are only unique per second and user
+        self.orders = Order.objects.bulk_create([
+            Order(order_number=f'STRESS-{i}', user=vendor, shipping_address='-', shipping_city='-',
+                  shipping_state='-', shipping_zipcode='-', shipping_country='-')
+            for i in range(self.threads * self.orders_per_thread)
+        ])
+
+    def test_concurrent_redemptions_stay_within_usage_limit(self):
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+        totals = {'uses': 0, 'refused': 0}
+        errors = []
+
+        def work(number):
+            try:
+                barrier.wait()
+                start = number * self.orders_per_thread
+                for i, order in enumerate(self.orders[start:start + self.orders_per_thread]):
+                    lines = [
+                        (product.id, product.price, Decimal('2.00'))
+                        for product in self.products[:1 + (number + i) % self.max_lines]
+                    ]
+                    try:
+                        redeem_discount(self.discount.id, order, lines)
+                        outcome = 'uses'
+                    except DiscountUnavailable:
+                        outcome = 'refused'
+                    with lock:
+                        totals[outcome] += 1
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work, args=(number,)) for number in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.discount.refresh_from_db()
+        # One use per order, whatever its number of lines
+        orders = DiscountUsage.objects.filter(discount=self.discount).values('order').distinct().count()
+        self.assertEqual(self.discount.usage_count, orders)
+        self.assertEqual(orders, totals['uses'])
+        self.assertEqual(totals['uses'], self.usage_limit)
+        self.assertGreater(totals['refused'], 0)
+        self.assertEqual(sum(DiscountUsageDaily.objects.values_list('uses', flat=True)), orders)
@@ -0,0 +1,157 @@
+"""
+Downsampled price-history series for charts.
+
+PriceHistory is a step function: each row holds a price from its start_date
+until the next row. A single windowed query groups the rows of a product
+into hour/day/week buckets (min, max and last price per bucket, plus the
+price carried in from before the window), and a Python pass fills buckets
+without changes from the previous price. Frequently viewed products keep
+their whole history as cached daily buckets, which also answer day and
+week requests without touching the database.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DateTimeField, F, Max, Min, Value, When, Window
+from django.db.models.functions import FirstValue, Trunc
+from django.utils import timezone
+
+from .cache import get_catalog_cache, price_series_key
+from .models import PriceHistory
+
+INTERVALS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+DEFAULT_SPANS = {
+    'hour': timedelta(days=2),
+    'day': timedelta(days=90),
+    'week': timedelta(weeks=104),
+}
+MAX_POINTS = 1000
+CENT = Decimal('0.01')
+
+# A product becomes "hot" after this many series requests within HOT_WINDOW seconds
+HOT_VIEWS = 10
+HOT_WINDOW = 60 * 60
+DAILY_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def floor_bucket(moment, interval):
+    """Start of the bucket containing `moment`, in the current time zone like Trunc()"""
+    local = timezone.localtime(moment)
+    if interval == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'week':
+        local -= timedelta(days=local.weekday())
+    return local
+
+
+def bucket_aggregates(product_id, interval, start=None, end=None):
+    """
+    One row per bucket with changes: {bucket, first, low, high, last}.
+
+    Rows before `start` fall in a single bucket `None`, whose `last` is the
+    price in effect when the window opens.
+    """
+    history = PriceHistory.objects.filter(product_id=product_id)
+    if end is not None:
+        history = history.filter(start_date__lt=end)
+
+    bucket = Trunc('start_date', interval, output_field=DateTimeField())
+    if start is not None:
+        bucket = Case(When(start_date__lt=start, then=Value(None)), default=bucket, output_field=DateTimeField())
+
+    rows = (
+        history.annotate(
+            bucket=bucket,
+            first=Window(Min('start_date'), partition_by=[bucket]),
+            low=Window(Min('original_price'), partition_by=[bucket]),
+            high=Window(Max('original_price'), partition_by=[bucket]),
+            last=Window(
+                FirstValue('original_price'), partition_by=[bucket],
+                order_by=[F('start_date').desc(), F('id').desc()]
+            ),
+        )
+        .values('bucket', 'first', 'low', 'high', 'last')
+        .order_by()
+        .distinct()
+    )
+    # Aggregated decimals come back unscaled on some backends (SQLite)
+    return [
+        dict(row, low=row['low'].quantize(CENT), high=row['high'].quantize(CENT), last=row['last'].quantize(CENT))
+        for row in rows
+    ]
+
+
+def rollup(daily_rows, interval, start, end):
+    """Regroup cached daily rows into `interval` buckets within [start, end)"""
+    groups = {}
+    for row in sorted(daily_rows, key=lambda row: row['first']):
+        if row['bucket'] >= end:
+            break
+        bucket = None if row['bucket'] < start else floor_bucket(row['bucket'], interval)
+        group = groups.get(bucket)
+        if group is None:
+            groups[bucket] = dict(row, bucket=bucket)
+        else:
+            group['low'] = min(group['low'], row['low'])
+            group['high'] = max(group['high'], row['high'])
+            group['last'] = row['last']
+    return list(groups.values())
+
+
+def fill_buckets(rows, interval, start, end):
+    """Min/max/last price for every bucket in [start, end) once a price exists"""
+    by_bucket = {row['bucket']: row for row in rows if row['bucket'] is not None}
+    price = next((row['last'] for row in rows if row['bucket'] is None), None)
+
+    points = []
+    moment = start
+    while moment < end:
+        row = by_bucket.get(moment)
+        if row is not None:
+            low, high = row['low'], row['high']
+            if price is not None and row['first'] > moment:
+                # The previous price was still in effect when the bucket opened
+                low, high = min(low, price), max(high, price)
+            price = row['last']
+            points.append({'time': moment, 'min': low, 'max': high, 'last': price})
+        elif price is not None:
+            points.append({'time': moment, 'min': price, 'max': price, 'last': price})
+        moment = floor_bucket(moment + INTERVALS[interval], interval)
+    return points
+
+
+def is_hot(product_id):
+    cache = get_catalog_cache()
+    key = f'price-series:views:{product_id}'
+    if cache.add(key, 1, timeout=HOT_WINDOW):
+        return HOT_VIEWS <= 1
+    try:
+        return cache.incr(key) >= HOT_VIEWS
+    except ValueError:
+        return False
+
+
+def get_daily_rows(product_id):
+    """All-time daily buckets of a hot product, from the cache when possible"""
+    cache = get_catalog_cache()
+    key = price_series_key(product_id)
+    rows = cache.get(key)
+    if rows is None:
+        rows = bucket_aggregates(product_id, 'day')
+        cache.set(key, rows, DAILY_CACHE_TIMEOUT)
+    return rows
+
+
+def price_series(product_id, interval, start, end):
+    """Downsampled series over [start, end), `start` aligned down to a bucket boundary"""
+    start = floor_bucket(start, interval)
+    if interval != 'hour' and is_hot(product_id):
+        rows = rollup(get_daily_rows(product_id), interval, start, end)
+    else:
+        rows = bucket_aggregates(product_id, interval, start, end)
+    return fill_buckets(rows, interval, start, end)
@@ -5,39 +5,55 @@ urlpatterns = [
     # Categories
     path('categories/', views.CategoryListView.as_view(), name='category-list'),
     path('categories/<int:pk>/', views.CategoryDetailView.as_view(), name='category-detail'),
+    path('categories/tree/', views.CategoryTreeView.as_view(), name='category-tree'),
     
     # Products
     path('', views.ProductListView.as_view(), name='product-list'),
     path('create/', views.ProductCreateView.as_view(), name='product-create'),
+    path('import/', views.ProductImportView.as_view(), name='product-import'),
     path('<int:id>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('<int:id>/update/', views.ProductUpdateView.as_view(), name='product-update'),
     path('<int:id>/delete/', views.ProductDeleteView.as_view(), name='product-delete'),
     
     # Vendor products
     path('vendor/my-products/', views.VendorProductListView.as_view(), name='vendor-product-list'),
+    path('vendor/export/', views.ProductExportView.as_view(), name='product-export'),
+    path('vendor/reprice/', views.BulkRepriceView.as_view(), name='product-bulk-reprice'),
     path('all-products/', views.AllProductsView.as_view(), name='all-products'),
+    path('search/', views.ProductSearchView.as_view(), name='product-search'),
     
     # Product images
     path('<int:product_id>/images/', views.ProductImageCreateView.as_view(), name='product-image-create'),
     path('images/<int:pk>/delete/', views.ProductImageDeleteView.as_view(), name='product-image-delete'),
     
     # Reviews
+    path('<int:product_id>/reviews/', views.ProductReviewListView.as_view(), name='product-reviews'),
+    path('<int:product_id>/reviews/create/', views.ReviewCreateView.as_view(), name='review-create'),
+    path('reviews/<int:pk>/update/', views.ReviewUpdateView.as_view(), name='review-update'),
+    path('reviews/<int:pk>/delete/', views.ReviewDeleteView.as_view(), name='review-delete'),
+    
+    # Discounts
     path('discounts/', views.DiscountListView.as_view(), name='discount-list'),
     path('discounts/<int:pk>/', views.DiscountDetailView.as_view(), name='discount-detail'),
+    path('discounts/<int:pk>/assign/', views.DiscountAssignmentView.as_view(), name='discount-assign'),
     
     # Public discount endpoints
     path('discounts/active/', views.ActiveDiscountsView.as_view(), name='active-discounts'),
     path('products/<int:product_id>/discounts/', views.ProductDiscountsView.as_view(), name='product-discounts'),
     path('calculate-discount/', views.CalculateDiscountView.as_view(), name='calculate-discount'),
+    path('cart/price/', views.CartPricingView.as_view(), name='cart-pricing'),
     
     # Vendor-specific endpoints
     path('vendor/products/<int:product_id>/discounts/', views.VendorProductDiscountsView.as_view(), name='vendor-product-discounts'),
     path('vendor/discounts/stats/', views.VendorDiscountStatsView.as_view(), name='vendor-discount-stats'),
+    path('vendor/discounts/usage/', views.VendorDiscountUsageReportView.as_view(), name='vendor-discount-usage'),
     path('vendor/discount-products/', views.VendorDiscountProductsView.as_view(), name='vendor-discount-products'),
     
     # Utility endpoints
     path('products/<int:product_id>/price-history/', views.PriceHistoryView.as_view(), name='price-history'),
+    path('products/<int:product_id>/price-history/series/', views.PriceSeriesView.as_view(), name='price-series'),
     path('discount-usage/', views.DiscountUsageView.as_view(), name='discount-usage'),
     path('flash-sales/', views.FlashSaleProductsView.as_view(), name='flash-sales'),
+    path('cache/stats/', views.CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
 
 ]
\ No newline at end of file
@@ -1,20 +1,63 @@
+import csv
+import math
+from datetime import datetime, time
 from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Q, Avg, Count
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.shortcuts import get_object_or_404
-from .models import Product, ProductImage, Review, Category
+from .models import Product, ProductImage, Review, Category, DiscountUsageDaily
 from .serializers import *
+from .pagination import (
+    DiscountUsageCursorPagination, ProductCursorPagination, ProductSearchPagination, ReviewCursorPagination
+)
+from .search import search_products
+from .facets import compute_facets, get_catalog_facets
+from .renderers import CATALOG_RENDERER_CLASSES
+from .cache import cache_catalog_response, conditional_catalog_response, get_cache_stats
+from .filters import filter_by_category_tree
+from .importer import FORMATS as IMPORT_FORMATS, ProductImporter, guess_format
+from .export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, export_products
+from .timeseries import DEFAULT_SPANS, INTERVALS, MAX_POINTS, price_series
+from .discounts import CENT, discount_index
+from .pricing import ZERO, line_discount_amount, price_cart
+from .assignment import AssignmentError, assign_discount
+from .repricing import MAX_PRICE, apply_price_changes, changes_from_prices, changes_from_rule
 from rest_framework import generics
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+
+# Responses with effective prices are cached for at most this long
+PRICED_MAX_TIMEOUT = 10 * 60
+
+def seconds_until(boundary, now, maximum):
+    """Cache timeout ending at `boundary`, between 1 and `maximum` seconds"""
+    if boundary is None:
+        return maximum
+    return max(1, min(maximum, math.ceil((boundary - now).total_seconds())))
+
+def discount_boundary_timeout(request, *args, **kwargs):
+    """Seconds until a discount starts or ends, changing effective prices"""
+    now = timezone.now()
+    return seconds_until(discount_index.next_boundary(now), now, PRICED_MAX_TIMEOUT)
+
+def last_discount_boundary(request, *args, **kwargs):
+    """When effective prices last changed without a catalog write"""
+    return discount_index.last_boundary()
 
 class CategoryListView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response
+    @cache_catalog_response()
     def get(self, request):
         categories = Category.objects.filter(is_active=True)
         serializer = CategorySerializer(categories, many=True)
@@ -22,7 +65,10 @@ class CategoryListView(APIView):
 
 class CategoryDetailView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response
+    @cache_catalog_response()
     def get(self, request, pk):
         category = get_object_or_404(Category, pk=pk, is_active=True)
         serializer = CategorySerializer(category)
@@ -30,15 +76,25 @@ class CategoryDetailView(APIView):
 
 class CategoryTreeView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response
     def get(self, request):
-        root_categories = Category.objects.filter(parent__isnull=True, is_active=True)
-        serializer = CategoryTreeSerializer(root_categories, many=True)
+        # Load the whole tree in one query and hand the serializer a parent -> children map
+        children = {}
+        for category in Category.objects.filter(is_active=True):
+            children.setdefault(category.parent_id, []).append(category)
+        
+        serializer = CategoryTreeSerializer(
+            children.get(None, []), many=True, context={'children': children}
+        )
         return Response(serializer.data)
 
 class ProductListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response(epoch=last_discount_boundary)
     def get(self, request):
         # Start with base queryset
         queryset = Product.objects.filter(is_active=True)
@@ -46,7 +102,7 @@ class ProductListView(APIView):
         # Apply filters from query parameters
         category_slug = request.query_params.get('category')
         if category_slug:
-            queryset = queryset.filter(categories__slug=category_slug)
+            queryset = filter_by_category_tree(queryset, category_slug)
         
         min_price = request.query_params.get('min_price')
         max_price = request.query_params.get('max_price')
@@ -59,35 +115,47 @@ class ProductListView(APIView):
         if in_stock and in_stock.lower() == 'true':
             queryset = queryset.filter(stock_quantity__gt=0)
         
-        # Apply search
+        # Apply full-text search (ranked by relevance unless another ordering is given)
         search_query = request.query_params.get('search')
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) | 
-                Q(description__icontains=search_query) |
-                Q(categories__name__icontains=search_query)
+            queryset = search_products(queryset, search_query)
+        
+        # Facet counts for the filter sidebar, on request
+        facets = None
+        include_facets = request.query_params.get('facets')
+        if include_facets and include_facets.lower() == 'true':
+            is_filtered = (
+                category_slug or min_price or max_price or search_query or
+                (in_stock and in_stock.lower() == 'true')
             )
+            facets = compute_facets(queryset) if is_filtered else get_catalog_facets()
         
-        # Apply ordering
-        ordering = request.query_params.get('ordering', '-created_at')
-        if ordering in ['price', '-price', 'created_at', '-created_at']:
-            queryset = queryset.order_by(ordering)
+        # Annotate ratings and prefetch images/categories
+        queryset = ProductListSerializer.setup_eager_loading(queryset, request)
         
-        # Annotate with ratings
-        queryset = queryset.annotate(
-            average_rating=Avg('reviews__rating'),
-            review_count=Count('reviews')
+        # Ordering (created_at/price) is applied by the keyset paginator
+        paginator = ProductSearchPagination() if search_query else ProductCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ProductListSerializer(
+            page, many=True, context={'field_selection': get_field_selection(request)}
         )
-        
-        serializer = ProductListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
 
 class ProductDetailView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response
+    @cache_catalog_response()
     def get(self, request, id):
-        product = get_object_or_404(Product, id=id, is_active=True)
-        serializer = ProductDetailSerializer(product)
+        queryset = ProductDetailSerializer.setup_eager_loading(Product.objects.all(), request)
+        product = get_object_or_404(queryset, id=id, is_active=True)
+        serializer = ProductDetailSerializer(
+            product, context={'field_selection': get_field_selection(request)}
+        )
         return Response(serializer.data)
 
 class ProductCreateView(APIView):
@@ -111,6 +179,40 @@ class ProductCreateView(APIView):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+class ProductImportView(APIView):
+    """Bulk create the vendor's products from an uploaded CSV or JSON Lines file"""
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+    
+    def post(self, request):
+        if not request.user.is_vendor:
+            return Response(
+                {"detail": "Only vendors can add products."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "A 'file' upload is required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {"error": f"Unsupported file format, use one of: {', '.join(IMPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        importer = ProductImporter(request.user)
+        try:
+            # Large uploads are spooled to disk by Django and read back line by line
+            report = importer.run(upload, file_format)
+        except (UnicodeDecodeError, csv.Error) as e:
+            report = importer.report()
+            report['error'] = f"Could not read the file: {e}"
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
 class ProductUpdateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -120,6 +222,7 @@ class ProductUpdateView(APIView):
     
     def put(self, request, id):
         product = self.get_object(id)
+        product._price_changed_by = request.user  # recorded on PriceHistory if the price changes
         serializer = ProductCreateSerializer(product, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -128,12 +231,51 @@ class ProductUpdateView(APIView):
     
     def patch(self, request, id):
         product = self.get_object(id)
+        product._price_changed_by = request.user  # recorded on PriceHistory if the price changes
         serializer = ProductCreateSerializer(product, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkRepriceView(APIView):
+    """Change the price of many of the vendor's products in one request"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        if not request.user.is_vendor:
+            return Response(
+                {"detail": "Only vendors can update prices."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = BulkRepriceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        with transaction.atomic():
+            if 'prices' in data:
+                changes, missing = changes_from_prices(request.user, data['prices'])
+                if missing:
+                    return Response(
+                        {"error": "Products not found", "ids": missing},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            else:
+                if not Category.objects.filter(slug=data['category']).exists():
+                    return Response({"error": "Category not found"}, status=status.HTTP_400_BAD_REQUEST)
+                changes = changes_from_rule(request.user, data['category'], data['percent'])
+                if any(price > MAX_PRICE for price in changes.values()):
+                    return Response(
+                        {"error": f"The rule would raise prices above {MAX_PRICE}"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            
+            updated = apply_price_changes(changes, changed_by=request.user)
+        
+        return Response({"updated": updated})
+
 class ProductDeleteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -174,6 +316,22 @@ class ProductImageDeleteView(APIView):
         product_image.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class ProductReviewListView(APIView):
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
+    
+    @conditional_catalog_response
+    @cache_catalog_response()
+    def get(self, request, product_id):
+        get_object_or_404(Product.objects.only('id'), id=product_id, is_active=True)
+        reviews = Review.objects.filter(product_id=product_id).select_related('user')
+        
+        # ordering: -created_at (newest, default), created_at, -rating, rating
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 class ReviewCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -187,9 +345,11 @@ class ReviewCreateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        serializer = ReviewSerializer(data=request.data)
+        serializer = ReviewSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save(product=product, user=request.user)
+            # The product's rating aggregates are updated in the same transaction
+            with transaction.atomic():
+                serializer.save(product=product, user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -204,7 +364,8 @@ class ReviewUpdateView(APIView):
         review = self.get_object(pk)
         serializer = ReviewSerializer(review, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -212,7 +373,8 @@ class ReviewUpdateView(APIView):
         review = self.get_object(pk)
         serializer = ReviewSerializer(review, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -225,36 +387,106 @@ class ReviewDeleteView(APIView):
     
     def delete(self, request, pk):
         review = self.get_object(pk)
-        review.delete()
+        with transaction.atomic():
+            review.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class VendorProductListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response(epoch=last_discount_boundary)
     def get(self, request):
         products = Product.objects.filter(vendor=request.user, is_active=True)
-        serializer = ProductListSerializer(products, many=True)
-        return Response(serializer.data)
+        products = ProductListSerializer.setup_eager_loading(products, request)
+        
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductListSerializer(
+            page, many=True, context={'field_selection': get_field_selection(request)}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+class ProductExportView(APIView):
+    """Stream the vendor's whole inventory (admins: the whole catalog) as JSON Lines or CSV"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        user = request.user
+        if not (user.is_vendor or user.is_admin_user):
+            return Response(
+                {"detail": "Only vendors can export products."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        file_format = request.query_params.get('file_format', 'jsonl')
+        if file_format not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {"error": f"Unsupported file format, use one of: {', '.join(EXPORT_CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Inactive products are included; the is_active column tells them apart
+        products = Product.objects.all() if user.is_admin_user else Product.objects.filter(vendor=user)
+        response = StreamingHttpResponse(
+            export_products(products, file_format),
+            content_type=EXPORT_CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
 
 class ProductSearchView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
     
+    @conditional_catalog_response(epoch=last_discount_boundary)
     def get(self, request):
         query = request.query_params.get('q', '')
         if not query:
             return Response([])
         
-        products = Product.objects.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(categories__name__icontains=query),
-            is_active=True
-        ).distinct()
+        products = search_products(Product.objects.filter(is_active=True), query)
+        products = ProductListSerializer.setup_eager_loading(products, request)
         
-        serializer = ProductListSerializer(products, many=True)
-        return Response(serializer.data)
+        paginator = ProductSearchPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductListSerializer(
+            page, many=True, context={'field_selection': get_field_selection(request)}
+        )
+        return paginator.get_paginated_response(serializer.data)
 
 #--------------------Discount and Price History Views----------------------#
+
+def get_discount_for_user(pk, user):
+    """Get discount object and verify ownership for vendors"""
+    discount = get_object_or_404(Discount, pk=pk)
+    if user.is_vendor and discount.created_by != user:
+        raise PermissionDenied("You don't have permission to access this discount")
+    return discount
+
+def discount_links(request):
+    """Serializer for the products/categories of a discount create or update, None if there are none"""
+    if 'products' not in request.data and 'categories' not in request.data:
+        return None
+    return DiscountAssignmentSerializer(data=request.data)
+
+def save_discount_links(discount, user, links):
+    """Replace the discount's links with the ones given in the request"""
+    if links is None:
+        return
+    assign_discount(
+        discount, user,
+        products=links.validated_data.get('products'),
+        categories=links.validated_data.get('categories'),
+        mode='replace',
+    )
+
+def assignment_error_response(exc, user):
+    return Response(
+        {"error": str(exc)},
+        status=status.HTTP_403_FORBIDDEN if user.is_vendor else status.HTTP_400_BAD_REQUEST
+    )
+
 class DiscountListView(APIView):
     serializer_class = DiscountSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -287,150 +519,94 @@ class DiscountListView(APIView):
     
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
-        if serializer.is_valid():
-            discount = serializer.save(created_by=self.request.user)
-            
-            # If user is vendor, validate product ownership
-            if request.user.is_vendor:
-                products = request.data.get('products', [])
-                if products:
-                    vendor_products = Product.objects.filter(
-                        id__in=products, 
-                        vendor=request.user
-                    )
-                    if vendor_products.count() != len(products):
-                        discount.delete()  # Rollback creation
-                        return Response(
-                            {"error": "You can only assign discounts to your own products"},
-                            status=status.HTTP_403_FORBIDDEN
-                        )
-                    discount.products.set(vendor_products)
-                
-                # Validate categories if specified
-                categories = request.data.get('categories', [])
-                if categories:
-                    vendor_categories = Category.objects.filter(
-                        id__in=categories,
-                        products__vendor=request.user
-                    ).distinct()
-                    if vendor_categories.count() != len(categories):
-                        discount.delete()  # Rollback creation
-                        return Response(
-                            {"error": "You can only assign discounts to categories containing your products"},
-                            status=status.HTTP_403_FORBIDDEN
-                        )
-                    discount.categories.set(vendor_categories)
-            
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        links = discount_links(request)
+        if links is not None and not links.is_valid():
+            return Response(links.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            # The discount and its links are created together or not at all
+            with transaction.atomic():
+                discount = serializer.save(created_by=self.request.user)
+                save_discount_links(discount, request.user, links)
+        except AssignmentError as exc:
+            return assignment_error_response(exc, request.user)
+        
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class DiscountDetailView(APIView):
     serializer_class = DiscountSerializer
     permission_classes = [permissions.IsAuthenticated]
     
-    def get_object(self, pk, user):
-        """Get discount object and verify ownership for vendors"""
-        discount = get_object_or_404(Discount, pk=pk)
-        if user.is_vendor and discount.created_by != user:
-            raise PermissionDenied("You don't have permission to access this discount")
-        return discount
-    
     def get(self, request, pk):
-        discount = self.get_object(pk, request.user)
+        discount = get_discount_for_user(pk, request.user)
         serializer = self.serializer_class(discount)
         return Response(serializer.data)
     
     def put(self, request, pk):
-        discount = self.get_object(pk, request.user)
-        
-        # Validate product ownership for vendors
-        if request.user.is_vendor and 'products' in request.data:
-            products = request.data.get('products', [])
-            if products:
-                vendor_products = Product.objects.filter(
-                    id__in=products, 
-                    vendor=request.user
-                )
-                if vendor_products.count() != len(products):
-                    return Response(
-                        {"error": "You can only assign discounts to your own products"},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-        
-        serializer = self.serializer_class(discount, data=request.data)
-        if serializer.is_valid():
-            updated_discount = serializer.save()
-            
-            # Update products if provided (for vendors, already validated above)
-            if 'products' in request.data:
-                products = request.data.get('products', [])
-                if request.user.is_vendor:
-                    vendor_products = Product.objects.filter(
-                        id__in=products, 
-                        vendor=request.user
-                    )
-                    updated_discount.products.set(vendor_products)
-                else:
-                    updated_discount.products.set(products)
-            
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self.update(request, pk, partial=False)
     
     def patch(self, request, pk):
-        discount = self.get_object(pk, request.user)
-        
-        # Validate product ownership for vendors
-        if request.user.is_vendor and 'products' in request.data:
-            products = request.data.get('products', [])
-            vendor_products = Product.objects.filter(
-                id__in=products, 
-                vendor=request.user
-            )
-            if vendor_products.count() != len(products):
-                return Response(
-                    {"error": "You can only assign discounts to your own products"},
-                    status=status.HTTP_403_FORBIDDEN
-                )
+        return self.update(request, pk, partial=True)
+    
+    def update(self, request, pk, partial):
+        discount = get_discount_for_user(pk, request.user)
+        serializer = self.serializer_class(discount, data=request.data, partial=partial)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        links = discount_links(request)
+        if links is not None and not links.is_valid():
+            return Response(links.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = self.serializer_class(discount, data=request.data, partial=True)
-        if serializer.is_valid():
-            updated_discount = serializer.save()
-            
-            # Update products if provided
-            if 'products' in request.data:
-                products = request.data.get('products', [])
-                if request.user.is_vendor:
-                    vendor_products = Product.objects.filter(
-                        id__in=products, 
-                        vendor=request.user
-                    )
-                    updated_discount.products.set(vendor_products)
-                else:
-                    updated_discount.products.set(products)
-            
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                serializer.save()
+                save_discount_links(discount, request.user, links)
+        except AssignmentError as exc:
+            return assignment_error_response(exc, request.user)
+        
+        return Response(serializer.data)
     
     def delete(self, request, pk):
-        discount = self.get_object(pk, request.user)
+        discount = get_discount_for_user(pk, request.user)
         discount.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class DiscountAssignmentView(APIView):
+    """Add, remove or replace a discount's products and categories in bulk"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, pk):
+        discount = get_discount_for_user(pk, request.user)
+        serializer = DiscountAssignmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        try:
+            with transaction.atomic():
+                result = assign_discount(
+                    discount, request.user,
+                    products=data.get('products'),
+                    categories=data.get('categories'),
+                    filters=data.get('filter'),
+                    mode=data['mode'],
+                )
+        except AssignmentError as exc:
+            return assignment_error_response(exc, request.user)
+        
+        result['mode'] = data['mode']
+        result['products_count'] = discount.products.count()
+        result['categories_count'] = discount.categories.count()
+        return Response(result)
+
 class ActiveDiscountsView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def get(self, request):
-        now = timezone.now()
-        active_discounts = Discount.objects.filter(
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now,
-            status='active'
-        ).exclude(
-            Q(usage_limit__isnull=False) & Q(usage_count__gte=models.F('usage_limit'))
-        )
-        
-        serializer = DiscountSerializer(active_discounts, many=True)
+        discounts = sorted(discount_index.active_at(), key=lambda discount: discount.created_at, reverse=True)
+        serializer = LiveDiscountSerializer(discounts, many=True)
         return Response(serializer.data)
 
 class ProductDiscountsView(APIView):
@@ -438,21 +614,13 @@ class ProductDiscountsView(APIView):
     
     def get(self, request, product_id):
         product = get_object_or_404(Product, id=product_id)
-        now = timezone.now()
+        category_ids = product.categories.values_list('id', flat=True)
         
         # Get discounts that apply to this product
-        discounts = Discount.objects.filter(
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now,
-            status='active'
-        ).filter(
-            Q(products=product) | 
-            Q(categories__in=product.categories.all()) |
-            Q(apply_to_all_products=True)
-        ).distinct()
+        discounts = discount_index.resolver().applicable(product.id, category_ids)
+        discounts.sort(key=lambda discount: discount.created_at, reverse=True)
         
-        serializer = DiscountSerializer(discounts, many=True)
+        serializer = LiveDiscountSerializer(discounts, many=True)
         return Response(serializer.data)
 
 class VendorProductDiscountsView(APIView):
@@ -490,28 +658,110 @@ class CalculateDiscountView(APIView):
         quantity = request.data.get('quantity', 1)
         
         product = get_object_or_404(Product, id=product_id)
-        discount = get_object_or_404(Discount, id=discount_id)
+        # Live discounts come from the in-memory index, anything else can only be inactive
+        discount = discount_index.get(int(discount_id)) if str(discount_id).isdigit() else None
+        # The index copy's usage_count is as old as its last reload, so limited
+        # discounts are checked against the database
+        if discount is None or discount.usage_limit is not None:
+            discount = get_object_or_404(Discount, id=discount_id)
         
         if not discount.is_currently_active:
             return Response(
                 {"error": "Discount is not currently active"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            return Response({"error": "quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
         
-        discount_amount = discount.calculate_discount_amount(
-            float(product.price), 
-            quantity
-        )
-        
-        final_price = float(product.price) - float(discount_amount)
+        # Decimal throughout; float arithmetic lost cents (and failed on percentage discounts)
+        discount_amount = line_discount_amount(discount, product.price, quantity)
+        line_total = product.price * quantity
+        final_price = line_total - discount_amount
         
         return Response({
             'original_price': product.price,
             'discount_amount': discount_amount,
             'final_price': final_price,
-            'discount_percentage': (float(discount_amount) / float(product.price)) * 100 if product.price > 0 else 0
+            'discount_percentage': (discount_amount * 100 / line_total).quantize(CENT) if line_total > 0 else 0
+        })
+
+def format_cart_discount(discount):
+    if discount is None:
+        return None
+    return {
+        'id': discount.id,
+        'name': discount.name,
+        'discount_type': discount.discount_type,
+        'discount_display': discount.get_discount_display(),
+    }
+
+class CartPricingView(APIView):
+    """Price a whole cart, with line and order discounts, in one request"""
+    permission_classes = [permissions.AllowAny]
+    
+    def post(self, request):
+        serializer = CartPricingSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        try:
+            breakdown = price_cart(data['items'], data.get('discount_id'))
+        except LookupError as exc:
+            return Response(
+                {"error": "Products not found", "ids": exc.args[0]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Money as strings so clients get exact cents
+        def money(amount):
+            return f"{amount:.2f}"
+        
+        return Response({
+            'items': [
+                {
+                    'product_id': line['product_id'],
+                    'title': line['title'],
+                    'quantity': line['quantity'],
+                    'unit_price': money(line['unit_price']),
+                    'line_total': money(line['line_total']),
+                    'discount': format_cart_discount(line['discount']),
+                    'discount_amount': money(line['discount_amount']),
+                    'order_discount_amount': money(line['order_discount_amount']),
+                    'total': money(line['total']),
+                }
+                for line in breakdown['items']
+            ],
+            'subtotal': money(breakdown['subtotal']),
+            'line_discounts': money(breakdown['line_discounts']),
+            'order_discount': format_cart_discount(breakdown['order_discount']),
+            'order_discount_amount': money(breakdown['order_discount_amount']),
+            'discount_total': money(breakdown['discount_total']),
+            'total': money(breakdown['total']),
+            'unapplied_discounts': breakdown['unapplied_discounts'],
         })
 
+def parse_history_bound(value, end_of_day=False):
+    """Aware datetime from an ISO datetime or date (a date covers the whole day)"""
+    try:
+        # Dates first: parse_datetime also accepts a bare date, as midnight
+        day = parse_date(value)
+        if day is not None:
+            moment = datetime.combine(day, time.max if end_of_day else time.min)
+        else:
+            moment = parse_datetime(value)
+            if moment is None:
+                return None
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
 class PriceHistoryView(APIView):
     serializer_class = PriceHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -526,10 +776,76 @@ class PriceHistoryView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        price_history = PriceHistory.objects.filter(product=product)
+        price_history = PriceHistory.objects.filter(product=product).select_related('discount')
+        
+        # ?start=&end= (ISO dates or datetimes): prices in effect at any time in the range
+        bounds = {}
+        for param in ('start', 'end'):
+            value = request.query_params.get(param)
+            if value:
+                bounds[param] = parse_history_bound(value, end_of_day=param == 'end')
+                if bounds[param] is None:
+                    return Response(
+                        {"error": f"Invalid {param}, use an ISO date or datetime"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        if 'end' in bounds:
+            price_history = price_history.filter(start_date__lte=bounds['end'])
+        if 'start' in bounds:
+            price_history = price_history.filter(
+                Q(end_date__isnull=True) | Q(end_date__gte=bounds['start'])
+            )
+        
         serializer = self.serializer_class(price_history, many=True)
         return Response(serializer.data)
 
+class PriceSeriesView(APIView):
+    """Min/max/last price per hour, day or week bucket, for charts"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, product_id):
+        product = get_object_or_404(Product.objects.only('id', 'vendor_id'), id=product_id)
+        
+        if request.user.is_vendor and product.vendor_id != request.user.id:
+            return Response(
+                {"error": "You can only view price history for your own products"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        interval = request.query_params.get('interval', 'day')
+        if interval not in INTERVALS:
+            return Response(
+                {"error": f"Invalid interval, use one of: {', '.join(INTERVALS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        bounds = {}
+        for param in ('start', 'end'):
+            value = request.query_params.get(param)
+            if value:
+                bounds[param] = parse_history_bound(value, end_of_day=param == 'end')
+                if bounds[param] is None:
+                    return Response(
+                        {"error": f"Invalid {param}, use an ISO date or datetime"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        end = bounds.get('end') or timezone.now()
+        start = bounds.get('start') or end - DEFAULT_SPANS[interval]
+        if start >= end:
+            return Response({"error": "start must be before end"}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start) / INTERVALS[interval] > MAX_POINTS:
+            return Response(
+                {"error": f"The range spans more than {MAX_POINTS} {interval}s, use a coarser interval"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            "interval": interval,
+            "start": start,
+            "end": end,
+            "points": price_series(product.id, interval, start, end),
+        })
+
 class DiscountUsageView(APIView):
     serializer_class = DiscountUsageSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -541,9 +857,13 @@ class DiscountUsageView(APIView):
         else:
             # For admin users, show all discount usage
             discount_usage = DiscountUsage.objects.all()
+        discount_usage = discount_usage.select_related('discount', 'order', 'user', 'product')
         
-        serializer = self.serializer_class(discount_usage, many=True)
-        return Response(serializer.data)
+        # ordering: -used_at (newest, default), used_at
+        paginator = DiscountUsageCursorPagination()
+        page = paginator.paginate_queryset(discount_usage, request, view=self)
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class VendorDiscountStatsView(APIView):
     """Get statistics for vendor's discounts"""
@@ -557,41 +877,126 @@ class VendorDiscountStatsView(APIView):
             )
         
         now = timezone.now()
-        vendor_discounts = Discount.objects.filter(created_by=request.user)
+        live = Q(is_active=True) & ~Q(status='cancelled')
+        # One query: the counts are window aggregates over all of the vendor's
+        # discounts, read off the row of the most used one
+        top = (
+            Discount.objects.filter(created_by=request.user)
+            .annotate(
+                total_discounts=models.Window(models.Count('id')),
+                active_discounts=models.Window(models.Count(
+                    'id', filter=live & Q(start_date__lte=now, end_date__gte=now)
+                )),
+                upcoming_discounts=models.Window(models.Count('id', filter=live & Q(start_date__gt=now))),
+                expired_discounts=models.Window(models.Count('id', filter=Q(end_date__lt=now))),
+                total_usage=models.Window(models.Sum('usage_count')),
+            )
+            .order_by('-usage_count', 'id')
+            .values(
+                'id', 'name', 'usage_count', 'total_discounts', 'active_discounts',
+                'upcoming_discounts', 'expired_discounts', 'total_usage'
+            )
+            .first()
+        )
+        if top is None:
+            return Response({
+                'total_discounts': 0,
+                'active_discounts': 0,
+                'upcoming_discounts': 0,
+                'expired_discounts': 0,
+                'total_usage': 0,
+                'most_popular_discount': None,
+            })
         
         stats = {
-            'total_discounts': vendor_discounts.count(),
-            'active_discounts': vendor_discounts.filter(
-                is_active=True,
-                start_date__lte=now,
-                end_date__gte=now,
-                status='active'
-            ).count(),
-            'upcoming_discounts': vendor_discounts.filter(
-                start_date__gt=now,
-                status='active'
-            ).count(),
-            'expired_discounts': vendor_discounts.filter(
-                end_date__lt=now
-            ).count(),
-            'total_usage': vendor_discounts.aggregate(
-                total_usage=models.Sum('usage_count')
-            )['total_usage'] or 0,
-            'most_popular_discount': self.get_most_popular_discount(vendor_discounts),
+            'total_discounts': top['total_discounts'],
+            'active_discounts': top['active_discounts'],
+            'upcoming_discounts': top['upcoming_discounts'],
+            'expired_discounts': top['expired_discounts'],
+            'total_usage': top['total_usage'] or 0,
+            'most_popular_discount': {
+                'id': top['id'],
+                'name': top['name'],
+                'usage_count': top['usage_count'],
+            },
         }
         
         return Response(stats)
+
+class VendorDiscountUsageReportView(APIView):
+    """Vendor's discount usage per day, week or month, from the daily rollup"""
+    permission_classes = [permissions.IsAuthenticated]
     
-    def get_most_popular_discount(self, discounts):
-        """Get the most used discount"""
-        most_popular = discounts.order_by('-usage_count').first()
-        if most_popular:
-            return {
-                'id': most_popular.id,
-                'name': most_popular.name,
-                'usage_count': most_popular.usage_count
-            }
-        return None
+    INTERVALS = {
+        'day': None,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+    
+    def get(self, request):
+        if not request.user.is_vendor:
+            return Response(
+                {"error": "Only vendors can access this endpoint"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        interval = request.query_params.get('interval', 'day')
+        if interval not in self.INTERVALS:
+            return Response(
+                {"error": f"interval must be one of: {', '.join(self.INTERVALS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rollups = DiscountUsageDaily.objects.filter(vendor=request.user)
+        for param, lookup in (('start', 'day__gte'), ('end', 'day__lte')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                day = parse_date(value)
+            except ValueError:
+                # Well-formed but not a real date, e.g. 2026-02-30
+                day = None
+            if day is None:
+                return Response(
+                    {"error": f"{param} must be a date (YYYY-MM-DD)"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            rollups = rollups.filter(**{lookup: day})
+        discount_id = request.query_params.get('discount')
+        if discount_id:
+            if not discount_id.isdigit():
+                return Response({"error": "discount must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+            rollups = rollups.filter(discount_id=int(discount_id))
+        
+        trunc = self.INTERVALS[interval]
+        period = trunc('day') if trunc else models.F('day')
+        totals = {
+            'uses': models.Sum('uses'),
+            'discount_given': models.Sum('discount_given'),
+            'revenue_affected': models.Sum('revenue_affected'),
+        }
+        rows = rollups.annotate(period=period).values('period').annotate(**totals).order_by('period')
+        overall = rollups.aggregate(**totals)
+        
+        def money(value):
+            return str((value or ZERO).quantize(CENT))
+        
+        return Response({
+            'interval': interval,
+            'uses': overall['uses'] or 0,
+            'discount_given': money(overall['discount_given']),
+            'revenue_affected': money(overall['revenue_affected']),
+            'series': [
+                {
+                    'period': row['period'],
+                    'uses': row['uses'],
+                    'discount_given': money(row['discount_given']),
+                    'revenue_affected': money(row['revenue_affected']),
+                }
+                for row in rows
+            ],
+        })
 
 class VendorDiscountProductsView(APIView):
     """Get all products that can have discounts applied (vendor's products)"""
@@ -609,60 +1014,86 @@ class VendorDiscountProductsView(APIView):
         return Response(serializer.data)
     
 
+# Flash sales are the discounts ending within this window
+FLASH_SALE_WINDOW = timezone.timedelta(hours=24)
+FLASH_SALE_MAX_TIMEOUT = 60 * 60
+
+def flash_sale_timeout(request, *args, **kwargs):
+    """Seconds until a discount starts, ends or enters the flash-sale window"""
+    now = timezone.now()
+    return seconds_until(discount_index.next_boundary(now, lead=FLASH_SALE_WINDOW), now, FLASH_SALE_MAX_TIMEOUT)
+
+def last_flash_sale_boundary(request, *args, **kwargs):
+    """When a discount last started, ended or entered the flash-sale window"""
+    return discount_index.last_boundary(lead=FLASH_SALE_WINDOW)
+
 class FlashSaleProductsView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
 
+    # Discount writes bump the catalog version; the clock is covered by expiring
+    # the snapshot at the next boundary and by folding the last one into the
+    # validators, so peak traffic is served from the cache or with a 304
+    @conditional_catalog_response(epoch=last_flash_sale_boundary)
+    @cache_catalog_response(timeout=flash_sale_timeout)
     def get(self, request):
         now = timezone.now()
-        # Define "flash sale" as discounts ending within the next 24 hours
-        upcoming_threshold = now + timezone.timedelta(hours=24)
+        upcoming_threshold = now + FLASH_SALE_WINDOW
 
         # Filter discounts that are active and expiring soon
-        flash_discounts = Discount.objects.filter(
-            is_active=True,
-            status='active',
-            end_date__lte=upcoming_threshold,
-            end_date__gte=now
-        ).prefetch_related('products')
+        flash_discounts = discount_index.ending_within(upcoming_threshold - now, now)
 
         products = Product.objects.filter(
-            discounts__in=flash_discounts,
+            id__in=discount_index.product_ids(flash_discounts),
             is_active=True
-        ).annotate(
-            average_rating=models.Avg('reviews__rating'),
-            review_count=models.Count('reviews')
-        ).distinct()
+        )
+        products = ProductListSerializer.setup_eager_loading(products, request)
 
-        serializer = ProductListSerializer(products, many=True)
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductListSerializer(
+            page, many=True, context={'field_selection': get_field_selection(request)}
+        )
         return Response({
             "flash_sales": serializer.data,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
             "current_time": now,
         })
 
 class AllProductsView(APIView):
     permission_classes = [permissions.AllowAny]
+    renderer_classes = CATALOG_RENDERER_CLASSES
 
+    @conditional_catalog_response(epoch=last_discount_boundary)
+    # Expires when the next discount starts or ends, as effective prices change
+    @cache_catalog_response(timeout=discount_boundary_timeout)
     def get(self, request):
         queryset = Product.objects.filter(is_active=True)
 
         # Optional: handle filters (like search, category, etc.)
         category_slug = request.query_params.get('category')
         if category_slug:
-            queryset = queryset.filter(categories__slug=category_slug)
+            queryset = filter_by_category_tree(queryset, category_slug)
 
         search_query = request.query_params.get('search')
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(categories__name__icontains=search_query)
-            )
+            queryset = search_products(queryset, search_query)
+
+        # Annotate ratings and prefetch images/categories
+        queryset = ProductListSerializer.setup_eager_loading(queryset, request)
 
-        # Annotate ratings
-        queryset = queryset.annotate(
-            average_rating=Avg('reviews__rating'),
-            review_count=Count('reviews')
+        paginator = ProductSearchPagination() if search_query else ProductCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ProductListSerializer(
+            page, many=True, context={'field_selection': get_field_selection(request)}
         )
+        return paginator.get_paginated_response(serializer.data)
 
-        serializer = ProductListSerializer(queryset, many=True)
-        return Response(serializer.data)
+
+class CatalogCacheStatsView(APIView):
+    """Hit/miss counters for the public catalog response cache"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_cache_stats())
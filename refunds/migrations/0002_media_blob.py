@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:51
+
+import product.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("refunds", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="refundevidence",
+            name="image",
+            field=models.ImageField(
+                storage=product.storage.ContentAddressedStorage(),
+                upload_to="refund_evidence/",
+            ),
+        ),
+    ]
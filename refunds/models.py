@@ -2,6 +2,7 @@
 from django.db import models
 from django.conf import settings
 from order.models import Order, OrderItem
+from product.storage import media_storage
 
 class RefundRequest(models.Model):
     REFUND_STATUS = [
@@ -84,7 +85,7 @@ class RefundItem(models.Model):
 class RefundEvidence(models.Model):
     """Evidence files for refund requests"""
     refund_request = models.ForeignKey(RefundRequest, on_delete=models.CASCADE, related_name='evidence_files')
-    image = models.ImageField(upload_to='refund_evidence/')
+    image = models.ImageField(upload_to='refund_evidence/', storage=media_storage)
     description = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     